@@ -1,17 +1,30 @@
 import argparse
+import hashlib
 import os
 import csv
+import zipfile
 import pandas as pd
 import matplotlib.pyplot as plt; plt.rcdefaults()
 import numpy as np
 import matplotlib.pyplot as plt
 from datetime import datetime
+import heapq
 import itertools
 
 TIME_COL_ID = 'Time sequence'
 RULE_COL_ID = 'Rule'
 ID_COL_ID = 'id'
 DEBUG_ENABLED = True
+PACING_METRICS = ["longest_dryspell", "gap_mean", "gap_variance", "burstiness"]
+# Rule sets masked over the timeline at once, to bound memory.
+PACING_CHUNK_SIZE = 4096
+# Bump when MovieIndex caches hold something different, so old ones are rebuilt.
+MOVIE_INDEX_VERSION = 2
+MOVIE_INDEX_SUFFIX = ".index.npz"
+# What reading a cache that's truncated, or isn't one, can raise.
+MOVIE_INDEX_READ_ERRORS = (OSError, ValueError, KeyError, IndexError, EOFError, zipfile.BadZipFile)
+# Spacing of the points on the drinks over time chart.
+PLOT_TICK_SECONDS = 30
 
 
 def get_movie_in_data_frame(file_path):
@@ -100,105 +113,315 @@ def sort_tuple(tup):
                 tup[j + 1]= temp 
     return tup 
 
-# Function to do insertion sort
-def insertion_sort_tuple_by_second_value(tuple_list, largest_first=False):
-  
-    # Traverse through 1 to len(tuple_list)
-    for i in range(1, len(tuple_list)):
-  
-        key = tuple_list[i]
-  
-        if (not largest_first):
-            # Move elements of arr[0..i-1], that are
-            # greater than key, to one position ahead
-            # of their current position
-            j = i-1
-            while j >=0 and key[1] < tuple_list[j][1] :
-                    tuple_list[j+1] = tuple_list[j]
-                    j -= 1
-            tuple_list[j+1] = key
-        else:
-            j = i-1
-            while j >=0 and key[1] > tuple_list[j][1] :
-                    tuple_list[j+1] = tuple_list[j]
-                    j -= 1
-            tuple_list[j+1] = key
-
+class TopK:
+    """
+    Keeps the best k items pushed, by key, in a bounded heap. Among equal keys the
+    earliest pushed wins, as a stable sort of everything pushed would order them.
+    """
+    k = None
+    largest_first = None
+    heap = None
+    pushed = None
+
+    def __init__(self, k, largest_first=False):
+        """
+        Args:
+            k(int): most items to keep
+            largest_first(bool): If true the largest keys are best, else the smallest
+        """
+        self.k = k
+        self.largest_first = largest_first
+        self.heap = []
+        self.pushed = 0
+
+    def push(self, item, key):
+        if self.k <= 0:
+            return
+        # The heap's top is the worst item kept: lowest rank, latest pushed.
+        rank = key if self.largest_first else -key
+        entry = (rank, -self.pushed, item)
+        self.pushed += 1
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+        elif rank > self.heap[0][0]:
+            heapq.heapreplace(self.heap, entry)
+
+    def get_sorted(self):
+        """
+        Returns:
+            list: items kept, best first
+        """
+        return [entry[2] for entry in sorted(self.heap, reverse=True)]
+
+
+def get_combination_reach(counts, combination_cap):
+    """
+    Args:
+        counts(list<int>): occurence count of each rule
+        combination_cap(int): most rules in a combination
+    Returns:
+        list<list<int>>: reach[i][n] is a bitmask of the totals that n of the rules from i on can add up to
+    """
+    reach = [[0] * (combination_cap + 1) for _ in range(len(counts) + 1)]
+    reach[len(counts)][0] = 1
+    for i in range(len(counts) - 1, -1, -1):
+        reach[i][0] = 1
+        for n in range(1, combination_cap + 1):
+            reach[i][n] = reach[i + 1][n] | reach[i + 1][n - 1] << counts[i]
+    return reach
+
+def iterate_rule_combinations_by_distance(counts, desired_total, sizes):
+    """
+    Yields every combination of rules with a size in sizes, closest to the desired total first.
+    Ties come in the order of sizes, then in itertools.combinations order, as brute force finds them.
+    Only combinations that add up to the total being looked for are walked, so this is
+    fast however many combinations there are.
+    Args:
+        counts(list<int>): occurence count of each rule
+        desired_total(int): total occurence count wanted
+        sizes(iterable<int>): combination sizes to consider, in order
+    Yields:
+        (tuple<int(rule index)>, int(how far the total is off))
+    """
+    sizes = list(sizes)
+    reach = get_combination_reach(counts, max(sizes, default=0))
+
+    def combinations_adding_to(start, n, totals, chosen):
+        if n == 0:
+            if 0 in totals:
+                yield tuple(chosen)
+            return
+        if not any(total >= 0 and reach[start][n] >> total & 1 for total in totals):
+            return
+        # Taking the rule before skipping it keeps itertools.combinations order.
+        chosen.append(start)
+        yield from combinations_adding_to(start + 1, n - 1, [total - counts[start] for total in totals], chosen)
+        chosen.pop()
+        yield from combinations_adding_to(start + 1, n, totals, chosen)
+
+    for distance in range(max(desired_total, sum(counts) - desired_total) + 1):
+        totals = sorted({desired_total - distance, desired_total + distance})
+        for n in sizes:
+            for combination in combinations_adding_to(0, n, totals, []):
+                yield combination, distance
 
 def get_closest_n_rule_combinations(rule_map, desired_drink_count, equal_consideration_count, combination_cap, prefer_more_rules, max_viable_combinations=5):
     """
     Args:
         rule_map: map<string, list<int(seconds duration from start)>>
+    Returns:
+        list<(tuple<string(rule)>, int(sips off target))>: the closest max_viable_combinations rule sets, and
+        any more that tie with the closest, up to equal_consideration_count
     """
-    values_as_count = []
-    values_as_count_map = {}
-    for key, val in rule_map.items():
-        values_as_count_map[key] = len(val)
-        values_as_count.append(len(val))
-
-    rule_count = len(rule_map.keys())
-
-    # list of tuples in form  [(rule_combination, abs_num_off_ideal)]
-    # We want the lowest value, closest to 0
-    combination_tuples = list()
+    rule_keys = list(rule_map.keys())
+    values_as_count = [len(rule_map[key]) for key in rule_keys]
+    rule_count = len(rule_keys)
 
-    # combination tuples of top N
-    top_n_rule_sets = list()
-
-    # Absolutely brute forcing this. 
     min_rule_count = 1
 
     range_func = range(min_rule_count, combination_cap)
     if prefer_more_rules:
         range_func = range(combination_cap, min_rule_count, -1)
 
-
-    print("Chugging on combinations... from size {} to {} for total rule count: {}".format(min_rule_count, combination_cap, rule_count))
-    # for n in range(1, 3):
-    for n in range_func:
-        # For Each rule (get all possible combinations of length n)
-        for subset in itertools.combinations(values_as_count_map.keys(), n):
-            #print(subset)
-            # Each subset should be a tuple / list of keys
-            total_occurences = 0
-            for key in subset:
-                total_occurences += values_as_count_map[key]
-            # print("Occurences: {}".format(total_occurences))
-            
-            # base case            
-            how_far_off = abs(desired_drink_count - total_occurences)
-            if len(top_n_rule_sets) < max_viable_combinations:
-                top_n_rule_sets.append((subset, how_far_off))
-                insertion_sort_tuple_by_second_value(top_n_rule_sets)
-                continue
-            
-            if how_far_off < top_n_rule_sets[max_viable_combinations - 1][1]:
-                print("Removing farther: {} for shorter: {}".format(top_n_rule_sets.pop()[1], how_far_off))
-                top_n_rule_sets.append((subset, how_far_off))
-                insertion_sort_tuple_by_second_value(top_n_rule_sets)
-                continue
-
-            # If we have a mega tie, don't want to lose precision...  fix this...
-            if len(top_n_rule_sets) < equal_consideration_count and how_far_off == top_n_rule_sets[0][1]:
-                top_n_rule_sets.append((subset, how_far_off))
-                insertion_sort_tuple_by_second_value(top_n_rule_sets)
-
-
-    print("Done chugging on combinations.. (total combinations: {}). Time to sort...".format(len(top_n_rule_sets)))
+    print("Finding combinations... from size {} to {} for total rule count: {}".format(min_rule_count, combination_cap, rule_count))
+    # combination tuples of top N, closest first
+    top_n_rule_sets = list()
+    for combination, how_far_off in iterate_rule_combinations_by_distance(values_as_count, desired_drink_count, range_func):
+        if len(top_n_rule_sets) >= max_viable_combinations:
+            # Past the top N, only keep going for ties with the closest.
+            if how_far_off > top_n_rule_sets[0][1] or len(top_n_rule_sets) >= equal_consideration_count:
+                break
+        top_n_rule_sets.append((tuple(rule_keys[i] for i in combination), how_far_off))
+
+    print("Done finding combinations.. (total combinations: {}).".format(len(top_n_rule_sets)))
     return top_n_rule_sets
 
 def get_longest_dryspell(list_of_events_seconds, movie_end_seconds):
-    list_of_events_seconds.append(movie_end_seconds)
-    list_of_events_seconds.sort()
-    biggest_diff = 0
-    for i, x in enumerate(list_of_events_seconds):
-        previous_val = 0
-        if i > 0:
-            previous_val = list_of_events_seconds[i - 1]
-        
-        if x - previous_val > biggest_diff:
-            biggest_diff = x - previous_val
-    return biggest_diff
+    """
+    Args:
+        list_of_events_seconds(list<int(seconds duration from start)>): left as is
+        movie_end_seconds(int): end of the movie
+    Returns:
+        float: longest time from the start, an event or the end to the next
+    """
+    events = np.sort(np.append(np.asarray(list_of_events_seconds, dtype=float), movie_end_seconds))
+    return float(np.diff(events, prepend=0).max())
+
+def get_rule_occurrence_arrays(rule_map):
+    """
+    Args:
+        rule_map: map<string, list<int(seconds duration from start)>>
+    Returns:
+        map<string, np.ndarray>: sorted occurence seconds of each rule
+    """
+    return {rule: np.sort(np.asarray(occurences, dtype=float)) for rule, occurences in rule_map.items()}
+
+def get_pacing_metrics(rule_arrays, rule_sets, movie_end_seconds):
+    """
+    Gap metrics for many rule sets at once. A rule set's gaps run from the start to
+    its first event, between its events, and from its last event to the end.
+    Every occurence is put on one sorted timeline once, and each rule set picks its events
+    out of it with a mask, a chunk of rule sets at a time, so nothing is sorted per rule set.
+    Args:
+        rule_arrays: map<string, np.ndarray> from get_rule_occurrence_arrays
+        rule_sets: list<tuple<string(rule)>>
+        movie_end_seconds(int): end of the movie
+    Returns:
+        map<string, np.ndarray>: per rule set, "longest_dryspell", "gap_mean", "gap_variance" and
+        "burstiness", (std - mean) / (std + mean) of the gaps: -1 evenly paced, 0 random, near 1 all at once
+    """
+    rules = list(rule_arrays.keys())
+    rule_indices = {rule: i for i, rule in enumerate(rules)}
+    times = np.concatenate([np.empty(0)] + [rule_arrays[rule] for rule in rules])
+    event_rules = np.repeat(np.arange(len(rules)), [len(rule_arrays[rule]) for rule in rules])
+    order = np.argsort(times, kind="stable")
+    # The end closes every rule set's last gap, so it is an event of every rule.
+    times = np.append(times[order], movie_end_seconds)
+    event_rules = np.append(event_rules[order], -1)
+
+    metrics = {metric: np.empty(len(rule_sets)) for metric in PACING_METRICS}
+    for start in range(0, len(rule_sets), PACING_CHUNK_SIZE):
+        chunk = rule_sets[start:start + PACING_CHUNK_SIZE]
+        in_set = np.zeros((len(chunk), len(rules) + 1), dtype=bool)
+        set_rows = np.repeat(np.arange(len(chunk)), [len(rule_set) for rule_set in chunk])
+        in_set[set_rows, [rule_indices[rule] for rule_set in chunk for rule in rule_set]] = True
+        in_set[:, -1] = True
+        # Row by row, nonzero gives each rule set's events in time order.
+        rows, events = np.nonzero(in_set[:, event_rules])
+        event_times = times[events]
+        gap_counts = np.bincount(rows, minlength=len(chunk))
+        gap_starts = np.cumsum(gap_counts) - gap_counts
+        gaps = np.diff(event_times, prepend=0)
+        gaps[gap_starts] = event_times[gap_starts]
+
+        gap_mean = np.add.reduceat(gaps, gap_starts) / gap_counts
+        gap_variance = np.add.reduceat((gaps - np.repeat(gap_mean, gap_counts)) ** 2, gap_starts) / gap_counts
+        gap_std = np.sqrt(gap_variance)
+        spread = gap_std + gap_mean
+        chunk_slice = slice(start, start + len(chunk))
+        metrics["longest_dryspell"][chunk_slice] = np.maximum.reduceat(gaps, gap_starts)
+        metrics["gap_mean"][chunk_slice] = gap_mean
+        metrics["gap_variance"][chunk_slice] = gap_variance
+        metrics["burstiness"][chunk_slice] = np.divide(gap_std - gap_mean, spread, out=np.zeros(len(chunk)), where=spread > 0)
+    return metrics
+
+
+class MovieIndex:
+    """
+    Everything the analyses need from a movie's CSV: each rule's sorted occurence
+    seconds and when the movie ends. Load caches it next to the CSV, so a movie is
+    only parsed again when its CSV changes.
+    """
+    rules = None
+    rule_arrays = None
+    end_seconds = None
+
+    def __init__(self, rule_map):
+        """
+        Args:
+            rule_map: map<string, list<int(seconds duration from start)>>
+        """
+        self.rules = list(rule_map.keys())
+        self.rule_arrays = get_rule_occurrence_arrays(rule_map)
+        # The movie is taken to end at the last recorded rule.
+        self.end_seconds = max([float(occurences[-1]) for occurences in self.rule_arrays.values() if len(occurences)], default=0)
+
+    def get_rule_rows(self, rule_set):
+        """
+        Returns:
+            list<int>: row of each rule in the rule x time matrices
+        """
+        return [self.rules.index(rule) for rule in rule_set]
+
+    def get_cumulative_counts(self, ticks):
+        """
+        Args:
+            ticks(np.ndarray): seconds from start to count up to
+        Returns:
+            np.ndarray: rule x tick matrix of how many times each rule has happened by each tick.
+            A rule set's drinks over time is the sum of its rules' rows.
+        """
+        cumulative_counts = np.zeros((len(self.rules), len(ticks)), dtype=np.int64)
+        for row, rule in enumerate(self.rules):
+            cumulative_counts[row] = np.searchsorted(self.rule_arrays[rule], ticks, side="right")
+        return cumulative_counts
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        Load the index cached next to the CSV, or parse the CSV and cache it. A cache
+        is used when the CSV's modified time and size match, or failing that, its hash.
+        A cache that can't be read is parsed again and replaced.
+        Args:
+            file_path(string): absolute path to file.
+        Returns:
+            MovieIndex
+        """
+        cache_path = file_path + MOVIE_INDEX_SUFFIX
+        source_stat = os.stat(file_path)
+        source_digest = None
+        if os.path.exists(cache_path):
+            try:
+                with np.load(cache_path, allow_pickle=False) as cache:
+                    cache_fields = {name: cache[name] for name in cache.files}
+                if int(cache_fields["version"]) == MOVIE_INDEX_VERSION:
+                    is_fresh = int(cache_fields["source_mtime_ns"]) == source_stat.st_mtime_ns and int(cache_fields["source_size"]) == source_stat.st_size
+                    if not is_fresh:
+                        source_digest = get_file_digest(file_path)
+                        is_fresh = str(cache_fields["source_sha256"]) == source_digest
+                    if is_fresh:
+                        return cls._from_cache(cache_fields)
+            except MOVIE_INDEX_READ_ERRORS as error:
+                print("Could not read movie index at {}, parsing the CSV again: {}".format(cache_path, error))
+
+        movie_index = cls(get_movie_in_data_frame(file_path))
+        try:
+            movie_index.save(cache_path, source_stat, source_digest or get_file_digest(file_path))
+        except OSError as error:
+            print("Could not cache movie index at {}: {}".format(cache_path, error))
+        return movie_index
+
+    @classmethod
+    def _from_cache(cls, cache_fields):
+        movie_index = cls.__new__(cls)
+        movie_index.rules = cache_fields["rules"].tolist()
+        occurence_counts = cache_fields["occurence_counts"]
+        if len(occurence_counts) != len(movie_index.rules) or occurence_counts.sum() != len(cache_fields["occurences"]):
+            raise ValueError("occurence counts don't match the rules and occurences")
+        occurences = np.split(cache_fields["occurences"], np.cumsum(occurence_counts)[:-1])
+        movie_index.rule_arrays = dict(zip(movie_index.rules, occurences))
+        movie_index.end_seconds = float(cache_fields["end_seconds"])
+        return movie_index
+
+    def save(self, cache_path, source_stat, source_digest):
+        """
+        Args:
+            cache_path(string): where to write the index
+            source_stat(os.stat_result): stat of the CSV the index was built from
+            source_digest(string): sha256 of the CSV
+        """
+        occurence_counts = [len(self.rule_arrays[rule]) for rule in self.rules]
+        temporary_path = cache_path + ".tmp"
+        # Written aside and moved into place, so a cache is never half written.
+        with open(temporary_path, "wb") as cache_file:
+            np.savez(cache_file,
+                version=MOVIE_INDEX_VERSION,
+                source_mtime_ns=source_stat.st_mtime_ns,
+                source_size=source_stat.st_size,
+                source_sha256=source_digest,
+                rules=np.array(self.rules, dtype=str),
+                occurences=np.concatenate([np.empty(0)] + [self.rule_arrays[rule] for rule in self.rules]),
+                occurence_counts=np.array(occurence_counts, dtype=np.int64),
+                end_seconds=self.end_seconds)
+        os.replace(temporary_path, cache_path)
+
+def get_file_digest(file_path):
+    """
+    Returns:
+        string: sha256 hex digest of the file
+    """
+    with open(file_path, "rb") as source_file:
+        return hashlib.sha256(source_file.read()).hexdigest()
 
 
 def format_and_print_ideal_n(mega_list, max_rules_to_choose_from):
@@ -212,8 +435,33 @@ def format_and_print_ideal_n(mega_list, max_rules_to_choose_from):
         # print("Rules: {}".format(mega_list[i][0]))
         print("Sips off target: {}".format(mega_list[i][2]))
         print("Longest dryspell in seconds: {}".format(mega_list[i][1]))
+        print("Burstiness (-1 steady, 1 all at once): {:.2f}".format(mega_list[i][3]))
         print("\n------------------ \n")
 
+def plot_cumulative_drinks(movie_index, cumulative_counts, ticks, labeled_rule_sets, title):
+    """
+    Overlay the drinks over time of each rule set on one chart. A single rule set is
+    drawn as its rules' stacked contributions under its total.
+    Args:
+        movie_index(MovieIndex): movie the rule sets are from
+        cumulative_counts(np.ndarray): movie_index.get_cumulative_counts(ticks)
+        ticks(np.ndarray): seconds from start of each point
+        labeled_rule_sets: list<(string(label), tuple<string(rule)>)>
+        title(string): chart title
+    """
+    fig, ax = plt.subplots()
+    minutes = ticks / 60
+    for label, rule_set in labeled_rule_sets:
+        rule_counts = cumulative_counts[movie_index.get_rule_rows(rule_set)]
+        if len(labeled_rule_sets) == 1:
+            ax.stackplot(minutes, rule_counts, labels=list(rule_set), alpha=0.6)
+        ax.plot(minutes, rule_counts.sum(axis=0), label=label)
+    ax.set_title(title)
+    ax.set_xlabel('Minutes')
+    ax.set_ylabel('Sips')
+    ax.legend(fontsize='small')
+    plt.show()
+
 def run_script(movie_csv, drinks, sips_per_drink, choices, equal_consideration_count, variation_rule_cap, prefer_more_rules, prefer_chaos):
     """
     Args:
@@ -227,21 +475,15 @@ def run_script(movie_csv, drinks, sips_per_drink, choices, equal_consideration_c
         prefer_chaos(bool): If true optimize for longest gap in satisfying rules. Else optimize for shortest gap
     """
     full_filepath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "datasets", movie_csv)
-    raw_table_dict = get_movie_in_data_frame(full_filepath)
-    # raw_table_dict = get_movie_in_data_frame(MOVIE_FILE_PATH)
+    movie_index = MovieIndex.load(full_filepath)
+    # map<string, np.ndarray<seconds duration from start>>
+    raw_table_dict = movie_index.rule_arrays
 
     sips_for_me = drinks * sips_per_drink
 
-    # map<string, list<int(seconds duration from start)>>
-    
     # want to get the end time of the movie, given the last recorded rule.
-    latest_rule = 0
-    values_as_count = []
-    for _, val in raw_table_dict.items():
-        values_as_count.append(len(val))
-        for dur in val:
-            if dur > latest_rule:
-                latest_rule = dur
+    latest_rule = movie_index.end_seconds
+    values_as_count = [len(val) for val in raw_table_dict.values()]
 
     # plt.bar(raw_table_dict.keys(), values_as_count)
     # plt.show()
@@ -249,57 +491,38 @@ def run_script(movie_csv, drinks, sips_per_drink, choices, equal_consideration_c
     # currently not actually N
     n_closest_list = get_closest_n_rule_combinations(raw_table_dict, sips_for_me, equal_consideration_count, variation_rule_cap, prefer_more_rules, choices)
 
-    # Keep a list of tuples  [(string id list, longest dry spell)]
-    n_closest_with_dryspell_tuple_list = list()
+    # Keep the best tuples  [(string id list, longest dry spell, sips off target, burstiness)]
+    ranked_rule_sets = TopK(choices, prefer_chaos)
 
-    # Get the closest 5 combinations of rules to my desired count
+    # Get the dryspells of every close combination of rules in one pass
     print("Now to evaluate based on {} targets, what are the dryspell times...".format(len(n_closest_list)))
-    for close_tuple in n_closest_list:
-        list_of_appended_event_times = []
-        for str_event_key in close_tuple[0]:
-            list_of_appended_event_times += raw_table_dict[str_event_key]
-        
-        # Now check for largest dryspell
-        n_closest_with_dryspell_tuple_list.append( ( close_tuple[0], get_longest_dryspell(list_of_appended_event_times, latest_rule), close_tuple[1]) )
+    pacing = get_pacing_metrics(movie_index.rule_arrays, [close_tuple[0] for close_tuple in n_closest_list], latest_rule)
+    for i, close_tuple in enumerate(n_closest_list):
+        longest_dryspell = float(pacing["longest_dryspell"][i])
+        ranked_rule_sets.push((close_tuple[0], longest_dryspell, close_tuple[1], float(pacing["burstiness"][i])), longest_dryspell)
 
 
-    print("Done getting dryspells, now to sort and grab first {}".format(choices))
-    insertion_sort_tuple_by_second_value(n_closest_with_dryspell_tuple_list, prefer_chaos)
+    print("Done getting dryspells, now to grab first {}".format(choices))
+    n_closest_with_dryspell_tuple_list = ranked_rule_sets.get_sorted()
     print("Done\n\n\n---------------------------------------------------")
 
-    format_and_print_ideal_n(n_closest_with_dryspell_tuple_list, choices)
-
-    rule_set_index = 0
-    while (rule_set_index != -1):
-        print("Which one do you choose? (Type the 'Rule Set' number).  Choose -1 to exit.")
-        rule_set_index = int(input()) -1
-        assert 0 <= rule_set_index < len(n_closest_with_dryspell_tuple_list)
-
-
-        fig, ax = plt.subplots()
-        x_axis = np.arange(0, latest_rule, 30)
-
-        list_of_appended_event_times = []
-        num_occurrences_before_time = 0 
-        for event_key in n_closest_with_dryspell_tuple_list[rule_set_index][0]:
-            list_of_appended_event_times += raw_table_dict[event_key]
-        list_of_appended_event_times.sort()
+    format_and_print_ideal_n(n_closest_with_dryspell_tuple_list, len(n_closest_with_dryspell_tuple_list))
 
+    # Each rule's count by every tick, so any rule sets chosen are only added up.
+    x_axis = np.arange(0, latest_rule, PLOT_TICK_SECONDS)
+    cumulative_counts = movie_index.get_cumulative_counts(x_axis)
 
-        y_axis_list = []
-        for timestamp in x_axis:        
-            num_occurrences = 0 
-            for event_time in list_of_appended_event_times:
-                if event_time <= timestamp:
-                    num_occurrences += 1
-                else:
-                    break
-            y_axis_list.append(num_occurrences)
+    while True:
+        print("Which one do you choose? (Type the 'Rule Set' number, or several to compare them).  Choose -1 to exit.")
+        rule_set_indices = [int(choice) - 1 for choice in input().replace(",", " ").split()]
+        if rule_set_indices == [-2]:
+            break
+        assert rule_set_indices
+        assert all(0 <= rule_set_index < len(n_closest_with_dryspell_tuple_list) for rule_set_index in rule_set_indices)
 
-        y_axis = np.array(y_axis_list)
-        ax.set_title('Movie: {}, Drinks: {}, Rules: {}'.format(movie_csv, drinks, len(n_closest_with_dryspell_tuple_list[rule_set_index][0])))
-        ax.plot(y_axis, color='blue', label='Drinks over time')
-        plt.show()
+        labeled_rule_sets = [("Rule set {}".format(rule_set_index + 1), n_closest_with_dryspell_tuple_list[rule_set_index][0]) for rule_set_index in rule_set_indices]
+        rule_counts = ", ".join(str(len(rule_set)) for _, rule_set in labeled_rule_sets)
+        plot_cumulative_drinks(movie_index, cumulative_counts, x_axis, labeled_rule_sets, 'Movie: {}, Drinks: {}, Rules: {}'.format(movie_csv, drinks, rule_counts))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Create your optimal drinking game experience for a movie!')
@@ -309,7 +532,7 @@ if __name__ == "__main__":
     parser.add_argument('--sips_per_drink', nargs='?', const=1, type=int, default=15, help='Sips per drink (for calculation)')
     parser.add_argument('--choices', nargs='?', const=1, type=int, default=10, help='Number of variations to choose from')
     parser.add_argument('--equal_consideration_count', nargs='?', const=1, type=int, default=2000, help='If there are ties for the first stage of drink equality checks, how many should we consider. (Higher the number more compute but more diverse results)')
-    parser.add_argument('--variation_rule_cap', nargs='?', const=1, type=int, default=6, help='Rule combination cap (recommend < 7 for performance)')
+    parser.add_argument('--variation_rule_cap', nargs='?', const=1, type=int, default=6, help='Rule combination cap')
     parser.add_argument('--prefer_more_rules', action='store_true', help='If enabled, we look for as many rules as we can to fill the drink criteria first. (We wearch until we hit a cap of "equal_consideration_count"). Otherwise we search for the shortest first by default.')
     parser.add_argument('--prefer_chaos', action='store_true', help='If you opt in to "prefer_chaos", you will reverse sort on the second pass when selecting a rule set priority based on the longest gap between rules. This implicitly suggests your rule set comes all at once for a "chaotic" experience..')
 
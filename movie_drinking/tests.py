@@ -0,0 +1,169 @@
+import itertools
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+from sit_sip_slurp import *
+import sit_sip_slurp
+
+def test_get_combination_reach():
+    test_random = random.Random(1)
+    for _ in range(50):
+        counts = [test_random.randint(0, 6) for _ in range(test_random.randint(0, 6))]
+        cap = test_random.randint(0, 4)
+        reach = get_combination_reach(counts, cap)
+        for i in range(len(counts) + 1):
+            for n in range(cap + 1):
+                totals = {sum(combination) for combination in itertools.combinations(counts[i:], n)}
+                assert reach[i][n] == sum(1 << total for total in totals)
+
+def test_iterate_rule_combinations_by_distance():
+    # Brute force: every combination of each size, stably sorted by how far off its total is.
+    test_random = random.Random(2)
+    for _ in range(100):
+        counts = [test_random.randint(0, 8) for _ in range(test_random.randint(0, 7))]
+        desired_total = test_random.randint(0, 30)
+        sizes = test_random.sample(range(1, 5), test_random.randint(0, 4))
+        brute_force = [(combination, abs(sum(counts[i] for i in combination) - desired_total))
+            for n in sizes for combination in itertools.combinations(range(len(counts)), n)]
+        brute_force.sort(key=lambda x: x[1])
+        assert list(iterate_rule_combinations_by_distance(counts, desired_total, sizes)) == brute_force
+
+def test_top_k():
+    # Brute force: a stable sort of everything pushed, cut to k.
+    test_random = random.Random(3)
+    for _ in range(100):
+        keys = [test_random.randint(0, 5) for _ in range(test_random.randint(0, 12))]
+        k = test_random.randint(0, 6)
+        for largest_first in [False, True]:
+            top_k = TopK(k, largest_first)
+            for item, key in enumerate(keys):
+                top_k.push(item, key)
+            brute_force = sorted(range(len(keys)), key=lambda item: keys[item], reverse=largest_first)
+            # reverse=True keeps equal keys in order, as TopK does.
+            assert top_k.get_sorted() == brute_force[:k]
+
+    top_k = TopK(0)
+    top_k.push("item", 1)
+    assert top_k.get_sorted() == []
+
+def get_random_rule_map(test_random, rule_count):
+    # Whole seconds, so rules often happen at the same time.
+    return {"rule {}".format(i): [float(test_random.randint(0, 60)) for _ in range(test_random.randint(0, 5))] for i in range(rule_count)}
+
+def test_get_pacing_metrics():
+    test_random = random.Random(4)
+    chunk_size = sit_sip_slurp.PACING_CHUNK_SIZE
+    # Small chunks, so rule sets are split across several.
+    sit_sip_slurp.PACING_CHUNK_SIZE = 3
+    try:
+        for _ in range(30):
+            rule_map = get_random_rule_map(test_random, test_random.randint(1, 6))
+            rules = list(rule_map.keys())
+            end_seconds = max([60.0] + [seconds for occurences in rule_map.values() for seconds in occurences])
+            rule_sets = [tuple(test_random.sample(rules, test_random.randint(1, len(rules)))) for _ in range(test_random.randint(1, 10))]
+            metrics = get_pacing_metrics(get_rule_occurrence_arrays(rule_map), rule_sets, end_seconds)
+            for i, rule_set in enumerate(rule_sets):
+                # Brute force: each rule set's own sorted events and gaps.
+                events = sorted(seconds for rule in rule_set for seconds in rule_map[rule]) + [end_seconds]
+                gaps = np.diff(events, prepend=0)
+                gap_std = gaps.std()
+                spread = gap_std + gaps.mean()
+                assert np.isclose(metrics["longest_dryspell"][i], gaps.max())
+                assert np.isclose(metrics["longest_dryspell"][i], get_longest_dryspell([seconds for rule in rule_set for seconds in rule_map[rule]], end_seconds))
+                assert np.isclose(metrics["gap_mean"][i], gaps.mean())
+                assert np.isclose(metrics["gap_variance"][i], gaps.var())
+                assert np.isclose(metrics["burstiness"][i], (gap_std - gaps.mean()) / spread if spread > 0 else 0)
+    finally:
+        sit_sip_slurp.PACING_CHUNK_SIZE = chunk_size
+
+def test_movie_index_load():
+    def assert_same_index(movie_index, expected):
+        assert movie_index.rules == expected.rules and movie_index.end_seconds == expected.end_seconds
+        for rule in expected.rules:
+            assert np.array_equal(movie_index.rule_arrays[rule], expected.rule_arrays[rule])
+
+    parsed_paths = []
+    def counting_parse(file_path):
+        parsed_paths.append(file_path)
+        return parse(file_path)
+
+    parse = sit_sip_slurp.get_movie_in_data_frame
+    sit_sip_slurp.get_movie_in_data_frame = counting_parse
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            movie_path = os.path.join(directory, "test_movie.csv")
+            cache_path = movie_path + MOVIE_INDEX_SUFFIX
+            shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)), "datasets", "test_movie.csv"), movie_path)
+            expected = MovieIndex(parse(movie_path))
+
+            assert_same_index(MovieIndex.load(movie_path), expected)
+            assert len(parsed_paths) == 1 and os.path.exists(cache_path)
+            assert_same_index(MovieIndex.load(movie_path), expected)
+            assert len(parsed_paths) == 1
+
+            # Only touched, so the hash still matches.
+            source_stat = os.stat(movie_path)
+            os.utime(movie_path, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns + 10 ** 9))
+            assert_same_index(MovieIndex.load(movie_path), expected)
+            assert len(parsed_paths) == 1
+
+            with open(movie_path, "a", encoding="utf8") as movie_file:
+                movie_file.write('new rule,"00:01:10\n"\n')
+            expected = MovieIndex(parse(movie_path))
+            assert "new rule" in expected.rules
+            assert_same_index(MovieIndex.load(movie_path), expected)
+            assert len(parsed_paths) == 2
+
+            # Caches that are truncated, someone else's or from another version are parsed again and replaced.
+            with open(cache_path, "rb") as cache_file:
+                cache_bytes = cache_file.read()
+            def write_truncated(cache_file):
+                cache_file.write(cache_bytes[:len(cache_bytes) // 2])
+            def write_garbage(cache_file):
+                cache_file.write(b"not a movie index")
+            def write_foreign(cache_file):
+                np.savez(cache_file, version=MOVIE_INDEX_VERSION, other=np.arange(3))
+            def write_old_version(cache_file):
+                np.savez(cache_file, version=MOVIE_INDEX_VERSION - 1)
+            for write_cache in [write_truncated, write_garbage, write_foreign, write_old_version]:
+                with open(cache_path, "wb") as cache_file:
+                    write_cache(cache_file)
+                parse_count = len(parsed_paths)
+                assert_same_index(MovieIndex.load(movie_path), expected)
+                assert len(parsed_paths) == parse_count + 1
+                assert_same_index(MovieIndex.load(movie_path), expected)
+                assert len(parsed_paths) == parse_count + 1
+    finally:
+        sit_sip_slurp.get_movie_in_data_frame = parse
+
+def test_get_cumulative_counts():
+    test_random = random.Random(5)
+    for _ in range(30):
+        rule_map = get_random_rule_map(test_random, test_random.randint(1, 5))
+        movie_index = MovieIndex(rule_map)
+        # Ticks land on events too, which count as already happened.
+        ticks = np.arange(0, 65, test_random.choice([1, 7, 30]))
+        cumulative_counts = movie_index.get_cumulative_counts(ticks)
+        assert cumulative_counts.shape == (len(movie_index.rules), len(ticks))
+        for row, rule in enumerate(movie_index.rules):
+            for column, tick in enumerate(ticks):
+                assert cumulative_counts[row, column] == sum(1 for seconds in rule_map[rule] if seconds <= tick)
+
+def run_tests():
+    test_get_combination_reach()
+    test_iterate_rule_combinations_by_distance()
+    test_top_k()
+    test_get_pacing_metrics()
+    test_movie_index_load()
+    test_get_cumulative_counts()
+
+if __name__ == "__main__":
+
+    logging.basicConfig(level=logging.DEBUG)
+    t0 = time.time()
+    run_tests()
+    t1 = time.time()
+    logging.info("Tests ran in {} seconds".format(t1 - t0))
@@ -0,0 +1,239 @@
+import argparse
+import hashlib
+import json
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+from game import *
+
+import numpy as np
+
+# Bump when build_corpus deals different hands. Results also carry a hash of
+# the hands, so a change that deals different ones without a bump is caught.
+CORPUS_VERSION = 2
+HANDS_PER_ROUND = 20
+PERCENTILES = [50, 90, 99]
+# A benchmark regresses when its median is this much slower than the baseline...
+REGRESSION_TOLERANCE = 0.25
+# ...and by more than this many milliseconds, so tiny timings don't flap.
+REGRESSION_FLOOR_MS = 0.5
+REGRESSION_FLOOR_KIB = 64
+
+def _deal_public_groups(deck, round):
+    """
+    Lay down the natural groups of a second, larger hand: a set of every value
+    held three or more times, then a run of every stretch of three or more of
+    one suit left. The groups don't go through the solver, so changing it
+    doesn't change the corpus.
+    Returns: list(Play) groups played, possibly empty
+    """
+    cards = sorted((deck.deal() for _ in range(round * 2)), key = lambda x: x.code)
+    non_wilds = [card for card in cards if not card.is_wild(round)]
+    groups = []
+    for value in range(1, WILD_VALUE):
+        value_cards = [card for card in non_wilds if card.value == value]
+        if len(value_cards) >= MIN_SET_LENGTH:
+            groups.append(SetPlay(value_cards, round))
+            non_wilds = [card for card in non_wilds if card.value != value]
+    for suit in Suits:
+        run = []
+        for card in non_wilds:
+            if card.suit != suit or (run and card.value == run[-1].value):
+                continue
+            if run and card.value != run[-1].value + 1:
+                if len(run) >= MIN_RUN_LENGTH:
+                    groups.append(RunPlay(run, round))
+                run = []
+            run.append(card)
+        if len(run) >= MIN_RUN_LENGTH:
+            groups.append(RunPlay(run, round))
+    return groups
+
+def build_corpus(hands_per_round = HANDS_PER_ROUND, rounds = range(3, 14), version = CORPUS_VERSION):
+    """
+    Deal the benchmark hands. The same version, size and rounds always deal the
+    same hands. Every hand is benchmarked both on an empty table and against
+    public groups dealt from the rest of its deck.
+    Returns: list((string, int, list(Card), list(Play))) case name, round, the
+        hand after drawing and the public groups
+    """
+    corpus = []
+    for round in rounds:
+        deal_random = random.Random("{}-{}".format(version, round))
+        for _ in range(hands_per_round):
+            deck = Deck(2, deal_random)
+            deck.shuffle()
+            cards = [deck.deal() for _ in range(round + 1)]
+            groups = []
+            while not groups and deck.length() >= round * 2:
+                groups = _deal_public_groups(deck, round)
+            corpus.append(("round{}/no_groups".format(round), round, cards, []))
+            corpus.append(("round{}/groups".format(round), round, cards, groups))
+    return corpus
+
+def get_corpus_hash(corpus):
+    """
+    Returns: string hash of every case's name, round, cards and groups
+    """
+    corpus_hash = hashlib.sha256()
+    for case, round, cards, groups in corpus:
+        group_codes = [[card.code for card in group.cards] for group in groups]
+        corpus_hash.update(json.dumps([case, round, [card.code for card in cards], group_codes]).encode())
+    return corpus_hash.hexdigest()
+
+def _run_get_all_plays(round, hand, groups):
+    return sum(1 for _ in get_all_plays(hand, round, groups))
+
+def _run_check_go_out(round, hand, groups):
+    check_go_out(hand, round, groups)
+
+def _run_determine_play(round, hand, groups):
+    # A fresh player each call, so every hand starts with a cold table.
+    Player("Benchmark").determine_play(hand, SimpleNamespace(round_number = round, public_groups = groups))
+
+BENCHMARKS = {
+    "get_all_plays": _run_get_all_plays,
+    "check_go_out": _run_check_go_out,
+    "determine_play": _run_determine_play,
+}
+
+def _measure(function, round, cards, groups):
+    """
+    Returns: (float, int) milliseconds taken and lines yielded, if any
+    """
+    hand = BitboardHand(list(cards))
+    start = time.perf_counter()
+    lines = function(round, hand, groups)
+    return (time.perf_counter() - start) * 1000, lines
+
+def _measure_peak_memory(function, round, cards, groups):
+    """
+    Measured in its own call, since tracing allocations skews the timing.
+    Returns: int peak bytes allocated during the call
+    """
+    hand = BitboardHand(list(cards))
+    tracemalloc.start()
+    try:
+        function(round, hand, groups)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def run_benchmarks(corpus, names = None):
+    """
+    Args:
+        corpus(list): result of build_corpus
+        names(list(string)): benchmarks to run, all of BENCHMARKS if None
+    Returns: dict(string, dict) stats for each "<benchmark>/<case>"
+    """
+    results = {}
+    for name in names or BENCHMARKS:
+        function = BENCHMARKS[name]
+        cases = {}
+        for case, round, cards, groups in corpus:
+            cases.setdefault(case, []).append((round, cards, groups))
+        for case, hands in cases.items():
+            latencies = []
+            lines = []
+            peak_bytes = 0
+            for round, cards, groups in hands:
+                latency, hand_lines = _measure(function, round, cards, groups)
+                latencies.append(latency)
+                lines.append(hand_lines)
+                peak_bytes = max(peak_bytes, _measure_peak_memory(function, round, cards, groups))
+            stats = {
+                "calls": len(latencies),
+                "mean_ms": float(np.mean(latencies)),
+                "max_ms": float(np.max(latencies)),
+                "lines": sum(lines) if None not in lines else None,
+                "peak_kib": peak_bytes / 1024,
+            }
+            for percentile in PERCENTILES:
+                stats["p{}_ms".format(percentile)] = float(np.percentile(latencies, percentile))
+            results["{}/{}".format(name, case)] = stats
+            logging.warning("{}/{}: p50 {:.2f}ms, p99 {:.2f}ms, lines {}, peak {:.0f}KiB".format(
+                name, case, stats["p50_ms"], stats["p99_ms"], stats["lines"], stats["peak_kib"]))
+    return results
+
+def compare_results(results, baseline, tolerance = REGRESSION_TOLERANCE):
+    """
+    Args:
+        results(dict): output of this run, as written by run_script
+        baseline(dict): earlier output to compare against
+        tolerance(float): fraction the median latency and peak memory may grow by
+    Returns: list(string) description of each regression found
+    """
+    _check_same_corpus(results, baseline)
+    regressions = []
+    for key, stats in results["benchmarks"].items():
+        if key not in baseline["benchmarks"]:
+            continue
+        base_stats = baseline["benchmarks"][key]
+        slowdown = stats["p50_ms"] - base_stats["p50_ms"]
+        if slowdown > REGRESSION_FLOOR_MS and stats["p50_ms"] > base_stats["p50_ms"] * (1 + tolerance):
+            regressions.append("{}: p50 {:.2f}ms, baseline {:.2f}ms".format(key, stats["p50_ms"], base_stats["p50_ms"]))
+        growth = stats["peak_kib"] - base_stats["peak_kib"]
+        if growth > REGRESSION_FLOOR_KIB and stats["peak_kib"] > base_stats["peak_kib"] * (1 + tolerance):
+            regressions.append("{}: peak {:.0f}KiB, baseline {:.0f}KiB".format(key, stats["peak_kib"], base_stats["peak_kib"]))
+    return regressions
+
+def compare_lines(results, baseline):
+    """
+    Changes to how many lines get_all_plays yields, which are reported but
+    aren't regressions: a change to which lines are searched makes them on
+    purpose.
+    Returns: list(string) description of each change found
+    """
+    _check_same_corpus(results, baseline)
+    changes = []
+    for key, stats in results["benchmarks"].items():
+        if key in baseline["benchmarks"] and stats["lines"] != baseline["benchmarks"][key]["lines"]:
+            changes.append("{}: yielded {} lines, baseline {}".format(key, stats["lines"], baseline["benchmarks"][key]["lines"]))
+    return changes
+
+def _check_same_corpus(results, baseline):
+    for field in ["corpus_version", "corpus_hash", "hands_per_round"]:
+        if results.get(field) != baseline.get(field):
+            raise Exception("Baseline was run on a different corpus: {} is {}, not {}".format(field, baseline.get(field), results.get(field)))
+
+def run_script(args):
+    rounds = args.rounds or list(range(3, 14))
+    corpus = build_corpus(args.hands, rounds)
+    results = {
+        "corpus_version": CORPUS_VERSION,
+        "corpus_hash": get_corpus_hash(corpus),
+        "hands_per_round": args.hands,
+        "benchmarks": run_benchmarks(corpus, args.benchmarks),
+    }
+
+    with open(args.output, "w") as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+    logging.warning("Wrote results to {}".format(args.output))
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_results(results, baseline, args.tolerance)
+        for change in compare_lines(results, baseline):
+            logging.warning("Changed: {}".format(change))
+        for regression in regressions:
+            logging.error("Regression: {}".format(regression))
+        if regressions:
+            return 1
+        logging.warning("No regressions against {}".format(args.baseline))
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the play solver on a fixed corpus of hands')
+    parser.add_argument('--hands', type=int, default=HANDS_PER_ROUND, help='Hands dealt per round')
+    parser.add_argument('--rounds', type=int, nargs='*', help='Rounds to benchmark, all if omitted')
+    parser.add_argument('--benchmarks', nargs='*', choices=list(BENCHMARKS), help='Benchmarks to run, all if omitted')
+    parser.add_argument('--output', default='benchmark_results.json', help='File to write results to')
+    parser.add_argument('--baseline', default=None, help='Earlier results file to check for regressions against')
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE, help='Fraction the median may slow down by before it is a regression')
+
+    logging.basicConfig(level=logging.WARNING)
+
+    args = parser.parse_args()
+    sys.exit(run_script(args))
@@ -1,14 +1,18 @@
 """Data structures"""
 
+import bisect
 import copy
 import logging
 import random
+import time
 
-from itertools import groupby, combinations
+from collections import Counter, OrderedDict
+from itertools import combinations
 from ordered_enum import OrderedEnum
-from functools import reduce
 
-logging.basicConfig(level=logging.DEBUG)
+# Logging through the module logger, rather than logging.debug(), doesn't
+# configure the root logger behind the back of whoever imports this.
+logger = logging.getLogger(__name__)
 
 CARD_TEXT_MAP = {
     1: 'A',
@@ -38,6 +42,13 @@ SUIT_TEXT_MAP = {
 MIN_SET_LENGTH = 3
 MIN_RUN_LENGTH = 3
 
+# Cards are encoded as a small int: suit * 16 + value. Values fit in the low
+# four bits (jokers carry 14), so a per-suit bitboard of held values fits in
+# an int and every card code fits in CARD_CODE_COUNT slots.
+SUIT_SHIFT = 4
+VALUE_MASK = (1 << SUIT_SHIFT) - 1
+WILD_VALUE = 14
+
 class Suits(OrderedEnum):
     CLUB = 0
     SPADE = 1
@@ -45,10 +56,32 @@ class Suits(OrderedEnum):
     DIAMOND = 3
     JOKER = 4
 
+SUIT_COUNT = len(Suits)
+CARD_CODE_COUNT = SUIT_COUNT << SUIT_SHIFT
+# Stands in for every wild in canonical play signatures; no card has this code.
+WILD_CODE = -1
+
+def encode_card(suit, value):
+    """
+    Args:
+        suit(Suits): suit of card
+        value(int): int number of card (e.g., Ace is 1)
+    Returns: int code of the card (suit * 16 + value)
+    """
+    return suit.value << SUIT_SHIFT | value
+
+def wild_value_mask(round):
+    """
+    Bitboard of the values that are wild in the given round.
+    """
+    return 1 << round | 1 << WILD_VALUE
+
 
 class Card:
     suit = None
     value = None
+    code = None
+    order = None
     is_fixed = None
     # Add visualization
 
@@ -60,15 +93,30 @@ class Card:
         """
         self.suit = suit
         self.value = value
+        self._encode()
         self.is_fixed = False
 
+    def _encode(self):
+        # Cards are never mutated after construction, so the int encodings
+        # can be computed once and compared instead of the enum.
+        self.code = encode_card(self.suit, self.value)
+        self.order = self.value << SUIT_SHIFT | self.suit.value
+
     def __eq__(self, other):
         if isinstance(other, Card):
-            return self.suit == other.suit and self.value == other.value
+            return self.code == other.code
         return False
     
     def __lt__(self, other):
-        return (self.value, self.suit) < (other.value, other.suit)
+        return self.order < other.order
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        # Cards are immutable values; sharing them is what makes copying
+        # hands and lines cheap.
+        return self
     
     def __sub__(self, other):
         return self.value - other.value
@@ -77,7 +125,7 @@ class Card:
         return "{}{}".format(SUIT_TEXT_MAP[self.suit.value], CARD_TEXT_MAP[self.value])
     
     def __hash__(self):
-        return hash(self.suit) + hash(self.value)
+        return self.code
     
     def same_suit(self, other):
         return self.suit == other.suit
@@ -86,13 +134,34 @@ class Card:
         return self.value == other.value
     
     def is_wild(self, round):
-        return self.value == round or self.suit == Suits.JOKER or self.value == 14
+        return self.value == round or self.value == WILD_VALUE or self.suit is Suits.JOKER
     
     def get_score(self, round):
         if self.is_wild(round):
             return 0
         return min(self.value, 10)
 
+def decode_card(code):
+    """
+    Args:
+        code(int): card code as returned by encode_card
+    Returns: Card
+    """
+    return Card(Suits(code >> SUIT_SHIFT), code & VALUE_MASK)
+
+# One shared instance per card code, handed out by code-based hands.
+CARDS_BY_CODE = [decode_card(code) for code in range(CARD_CODE_COUNT)]
+
+def get_random(seed = None):
+    """
+    Args:
+        seed(random.Random|int|None): generator to share, or seed for a new one
+    Returns: random.Random
+    """
+    if isinstance(seed, random.Random):
+        return seed
+    return random.Random(seed)
+
 def create_all_card_suits_for_value(value):
     cards = []
     for suit in Suits:
@@ -110,6 +179,7 @@ class FixedCard(Card):
             raise "Cannot fix suit of wild card to Joker: {}".format(self)
         self.value = fixed_card.value
         self.suit = fixed_card.suit
+        self._encode()
         self.is_fixed = True
         self.wild_card = wild_card
 
@@ -117,7 +187,7 @@ class FixedCard(Card):
         return "{}{}({}{})".format(SUIT_TEXT_MAP[self.suit.value], CARD_TEXT_MAP[self.value], SUIT_TEXT_MAP[self.wild_card.suit.value], CARD_TEXT_MAP[self.wild_card.value])
 
     def __hash__(self):
-        return hash(self.suit) + hash(self.value) + hash(self.wild_card)
+        return self.code + hash(self.wild_card)
     
     def is_wild(self, round):
         return False
@@ -127,8 +197,15 @@ class FixedCard(Card):
 
 class Deck:
     cards = None
+    random = None
 
-    def __init__(self, decks=2):
+    def __init__(self, decks=2, seed=None):
+        """
+        Args:
+            decks(int): number of standard decks to combine
+            seed(random.Random|int|None): generator or seed used to shuffle
+        """
+        self.random = get_random(seed)
         self.cards = []
         for _ in range(0, decks):
             for suit in Suits:
@@ -138,10 +215,10 @@ class Deck:
                 else:
                     for value in range(1,14):
                         self.cards.append(Card(suit, value))
-        logging.info("Cards in deck: {}".format(len(self.cards)))
+        logger.debug("Cards in deck: %d", len(self.cards))
 
     def shuffle(self):
-        random.shuffle(self.cards)
+        self.random.shuffle(self.cards)
 
     def deal(self):
         if self.length():
@@ -174,12 +251,37 @@ class Hand:
             card(Card): card to remove from your hand
         Returns: bool (success)
         """
-        for c in self.cards:
-            if c == card:
-                self.cards.remove(card)
-                return True
-        return False
+        try:
+            self.cards.remove(card)
+        except ValueError:
+            return False
+        return True
     
+    def remove_all(self, cards):
+        """
+        Remove each of the cards from your hand, skipping any you don't hold.
+        Args:
+            cards(list(Card)): cards to remove from your hand
+        Returns: list((int, Card)) record of what was removed, for restore()
+        """
+        removed = []
+        for card in cards:
+            try:
+                index = self.cards.index(card)
+            except ValueError:
+                continue
+            removed.append((index, self.cards.pop(index)))
+        return removed
+
+    def restore(self, removed):
+        """
+        Undo a remove_all(), putting the cards back in their original positions.
+        Args:
+            removed(list((int, Card))): record returned by remove_all()
+        """
+        for index, card in reversed(removed):
+            self.cards.insert(index, card)
+
     def __repr__(self):
         return str(self.cards)
 
@@ -202,6 +304,13 @@ class Hand:
         """
         wilds = sorted(list(filter(lambda x: x.is_wild(round), self.cards)))
         return wilds
+
+    def get_unique_non_wilds(self, round):
+        """
+        Return a temporary sorted list of the non-wild cards, ignoring duplicates
+        from multiple decks.
+        """
+        return sorted(set(self.get_non_wilds(round)))
     
     def get_score(self, round):
         return sum(map(lambda x: x.get_score(round), self.cards))
@@ -217,6 +326,134 @@ class Hand:
         self.remove(highest_value)
         return highest_value
 
+class BitboardHand(Hand):
+    """
+    Hand that also keeps a count per card code and a per-suit bitboard of the
+    values held, so the solver can split wilds from non-wilds and find unique
+    cards without re-testing and re-sorting every card object.
+    """
+    counts = None
+    suit_masks = None
+
+    def __init__(self, cards = None):
+        super().__init__(cards)
+        self.counts = [0] * CARD_CODE_COUNT
+        self.suit_masks = [0] * SUIT_COUNT
+        for card in self.cards:
+            self._count(card.code, 1)
+
+    def __deepcopy__(self, memo):
+        hand_copy = BitboardHand.__new__(BitboardHand)
+        hand_copy.cards = list(self.cards)
+        hand_copy.counts = list(self.counts)
+        hand_copy.suit_masks = list(self.suit_masks)
+        return hand_copy
+
+    def _count(self, code, delta):
+        self.counts[code] += delta
+        suit, value = code >> SUIT_SHIFT, code & VALUE_MASK
+        if self.counts[code]:
+            self.suit_masks[suit] |= 1 << value
+        else:
+            self.suit_masks[suit] &= ~(1 << value)
+
+    def add(self, card):
+        """
+        Args:
+            card(Card): card to add to the hand
+        """
+        self.cards.append(card)
+        self._count(card.code, 1)
+
+    def remove(self, card):
+        """
+        Args:
+            card(Card): card to remove from your hand
+        Returns: bool (success)
+        """
+        if not super().remove(card):
+            return False
+        self._count(card.code, -1)
+        return True
+
+    def remove_all(self, cards):
+        """
+        Remove each of the cards from your hand, skipping any you don't hold.
+        Args:
+            cards(list(Card)): cards to remove from your hand
+        Returns: list((int, Card)) record of what was removed, for restore()
+        """
+        removed = super().remove_all(cards)
+        for _, card in removed:
+            self._count(card.code, -1)
+        return removed
+
+    def restore(self, removed):
+        """
+        Undo a remove_all(), putting the cards back in their original positions.
+        Args:
+            removed(list((int, Card))): record returned by remove_all()
+        """
+        super().restore(removed)
+        for _, card in removed:
+            self._count(card.code, 1)
+
+    def clear(self):
+        self.cards.clear()
+        self.counts = [0] * CARD_CODE_COUNT
+        self.suit_masks = [0] * SUIT_COUNT
+
+    def _held_values(self, value_mask):
+        """
+        Yield each value in value_mask held in any suit, lowest first.
+        """
+        held = 0
+        for suit_mask in self.suit_masks:
+            held |= suit_mask
+        held &= value_mask
+        while held:
+            low_bit = held & -held
+            held ^= low_bit
+            yield low_bit.bit_length() - 1
+
+    def get_non_wilds(self, round):
+        """
+        Return a temporary list of all the cards ignoring wilds, built from the
+        card counts in (value, suit) order.
+        """
+        non_wilds = []
+        for value in self._held_values(~wild_value_mask(round)):
+            for suit in range(SUIT_COUNT):
+                count = self.counts[suit << SUIT_SHIFT | value]
+                if count:
+                    non_wilds.extend([CARDS_BY_CODE[suit << SUIT_SHIFT | value]] * count)
+        return non_wilds
+
+    def get_wilds(self, round):
+        """
+        Return a temporary list of all the cards ignoring non-wilds, built from
+        the card counts in (value, suit) order.
+        """
+        wilds = []
+        for value in self._held_values(wild_value_mask(round)):
+            for suit in range(SUIT_COUNT):
+                count = self.counts[suit << SUIT_SHIFT | value]
+                if count:
+                    wilds.extend([CARDS_BY_CODE[suit << SUIT_SHIFT | value]] * count)
+        return wilds
+
+    def get_unique_non_wilds(self, round):
+        """
+        Return a temporary sorted list of the non-wild cards, ignoring duplicates
+        from multiple decks, read straight from the bitboards.
+        """
+        unique_non_wilds = []
+        for value in self._held_values(~wild_value_mask(round)):
+            for suit in range(SUIT_COUNT):
+                if self.suit_masks[suit] & 1 << value:
+                    unique_non_wilds.append(CARDS_BY_CODE[suit << SUIT_SHIFT | value])
+        return unique_non_wilds
+
 class DiscardPile:
     cards = None
 
@@ -251,6 +488,11 @@ class PlayExtension:
         self.last_value = last_value if last_value is not None else first_value
         self.suit = suit
         self.round = round
+
+    def __deepcopy__(self, memo):
+        # Extensions are never modified once calculated; plays recalculate
+        # them instead.
+        return self
     
     def __contains__(self, item):
         if isinstance(item, Card):
@@ -274,6 +516,81 @@ class PlayExtension:
     def _in(self, value):
         return value >= self.first_value and value <= self.last_value
 
+def _build_extension_tables(round):
+    """
+    Precompute the extensions of every valid set and run in a round.
+    Returns: (dict, dict) set table keyed by set value (0 for all wilds) and
+    run table keyed by (suit value, first value, length)
+    """
+    set_table = {0: PlayExtension(round, Suits.JOKER, 1, 13)}
+    for value in range(1, WILD_VALUE):
+        set_table[value] = PlayExtension(round, Suits.JOKER, value)
+
+    run_table = {}
+    # Runs of only wilds can represent any suit, so they are keyed by the
+    # joker suit and value.
+    for length in range(0, 14):
+        if length == 13:
+            # Valid, but no extensions.
+            extensions = (None, None)
+        elif length == 12:
+            # Valid, with one side able to be expanded.
+            extensions = (PlayExtension(round, Suits.JOKER, 1), None)
+        else:
+            # Valid, with both sides able to be expanded.
+            extensions = (PlayExtension(round, Suits.JOKER, 1, 13 - length),
+                          PlayExtension(round, Suits.JOKER, length + 1, 13))
+        run_table[(Suits.JOKER.value, WILD_VALUE, length)] = extensions
+    for suit in Suits:
+        if suit == Suits.JOKER:
+            continue
+        for first_value in range(1, 14):
+            # The extensions only depend on where the run starts and ends, not
+            # on which of its cards are wild.
+            lower_extension = PlayExtension(round, suit, first_value - 1) if first_value - 1 >= 1 else None
+            for length in range(1, 15 - first_value):
+                upper_extension = PlayExtension(round, suit, first_value + length) if first_value + length <= 13 else None
+                run_table[(suit.value, first_value, length)] = (lower_extension, upper_extension)
+    return set_table, run_table
+
+EXTENSION_TABLES = {round: _build_extension_tables(round) for round in range(3, 14)}
+
+def _get_extension_tables(round):
+    if round not in EXTENSION_TABLES:
+        EXTENSION_TABLES[round] = _build_extension_tables(round)
+    return EXTENSION_TABLES[round]
+
+def get_set_extensions(cards, round):
+    """
+    Returns: PlayExtension of the values the cards can be grown by as a set,
+    or None if they aren't a set
+    """
+    set_value = 0
+    for card in cards:
+        if card.is_wild(round):
+            continue
+        if set_value and card.value != set_value:
+            return None
+        set_value = card.value
+    return _get_extension_tables(round)[0][set_value]
+
+def get_run_extensions(cards, round):
+    """
+    Returns: (PlayExtension, PlayExtension) lower and upper extensions of the
+    cards as a run (either None if that end is closed), or None if they aren't
+    a run
+    """
+    # Figure out what the first card of the run must be, even if it's actually a wild.
+    suit, first_value = Suits.JOKER.value, WILD_VALUE
+    for i, card in enumerate(cards):
+        if card.is_wild(round):
+            continue
+        if suit == Suits.JOKER.value:
+            suit, first_value = card.code >> SUIT_SHIFT, card.value - i
+        elif card.code >> SUIT_SHIFT != suit or card.value != first_value + i:
+            return None
+    return _get_extension_tables(round)[1].get((suit, first_value, len(cards)))
+
 class Play:
     cards = None
     round = None
@@ -292,6 +609,15 @@ class Play:
             return self.cards == other.cards and self.round == other.round
         return False
     
+    def copy(self):
+        """
+        Return a copy of this play that can be grown or fixed without
+        affecting this one.
+        """
+        play_copy = copy.copy(self)
+        play_copy.cards = list(self.cards)
+        return play_copy
+
     def get_possible_extensions(self):
         if not self._extensions:
             self._extensions = self._calculate_extensions()
@@ -342,14 +668,7 @@ class SetPlay(Play):
                 self.cards[i] = FixedCard(Card(Suits.CLUB, value), card, self.round)
     
     def _calculate_extensions(self):
-        filter_cards = list(filter(lambda x: not x.is_wild(self.round), self.cards))
-        if not filter_cards:
-            return PlayExtension(self.round, Suits.JOKER, 1, 13)
-        
-        set_value = reduce(lambda x, y: x if x == y else 0, map(lambda x: x.value, filter_cards), filter_cards[0].value)
-        if set_value:
-            return PlayExtension(self.round, Suits.JOKER, set_value)
-        return None
+        return get_set_extensions(self.cards, self.round)
 
 class RunPlay(Play):
     def __init__(self, cards, round, min_run_length = MIN_RUN_LENGTH):
@@ -404,36 +723,7 @@ class RunPlay(Play):
         return Card(Suits.JOKER, 14)
 
     def _calculate_extensions(self):
-        # Figure out what the first card of the run must be, even if it's actually a wild.
-        first_card = self._get_first_represented_card()
-        if first_card.suit == Suits.JOKER:
-            # All wilds.
-            if (len(self.cards) > 13):
-                # Invalid run.
-                return None
-            elif (len(self.cards) == 13):
-                # Valid, but no extensions.
-                return (None, None)
-            elif (len(self.cards) == 12):
-                # Valid, with one side able to be expanded.
-                if first_card.value == 1:
-                    return (None, PlayExtension(self.round, Suits.JOKER, 13))
-                else:
-                    return (PlayExtension(self.round, Suits.JOKER, 1), None)
-            else:
-                # Valid, with both sides able to be expanded.
-                return (PlayExtension(self.round, Suits.JOKER, 1, 13 - len(self.cards)),
-                        PlayExtension(self.round, Suits.JOKER, len(self.cards) + 1, 13))
-        if first_card.value < 1:
-            # A wild necessarily is representing an illegal value.
-            return None
-        for i, card in enumerate(self.cards):
-            expected_value = first_card.value + i
-            if expected_value > 13 or (not card.is_wild(self.round) and (card.value != expected_value or card.suit != first_card.suit)):
-                return None
-        # This is a valid run. Get the first and last values.
-        return (PlayExtension(self.round, first_card.suit, first_card.value - 1) if first_card.value - 1 >= 1 else None,
-                PlayExtension(self.round, first_card.suit, first_card.value + len(self.cards)) if first_card.value + len(self.cards) <= 13 else None)
+        return get_run_extensions(self.cards, self.round)
     
     def select_possible_extensions_from_hand(self, hand):
         possible_lower_extensions, possible_upper_extensions = set(), set()
@@ -467,14 +757,9 @@ class PublicGroupPlay(Play):
     def can_add_card(self, card, grow_right = True):
         if grow_right != self.grow_right:
             return False
-        try:
-            if grow_right:
-                self._create_total_group(self.cards + card)
-            else:
-                self._create_total_group(card + self.cards)
-        except:
-            return False
-        return True
+        if grow_right:
+            return self._get_total_group_extensions(self.cards + [card]) is not None
+        return self._get_total_group_extensions([card] + self.cards) is not None
         
     def fix_wilds(self, fix_value = 1):
         fixed_play = self._create_total_group(self.cards)
@@ -486,9 +771,10 @@ class PublicGroupPlay(Play):
             self.cards = fixed_play.cards[:len(self.cards)]
 
     def execute_on(self, hand, public_groups):
-        if self.group not in public_groups:
-            print("{} not in {}".format(self.group, public_groups))
-        public_group = next(x for x in public_groups if x == self.group)
+        public_groups = _get_public_table(public_groups)
+        public_group = public_groups.find(self.group)
+        if public_group is None:
+            raise Exception("{} not in {}".format(self.group, public_groups))
         public_group.add_cards(self.cards, self.grow_right)
         for card in self.cards:
             if card.is_fixed:
@@ -496,43 +782,254 @@ class PublicGroupPlay(Play):
             else:
                 hand.remove(card)
         public_group.fix_wilds()
+        public_groups.update(public_group)
         return public_group
 
-    def _create_total_group(self, cards):
+    def _get_total_group(self, cards):
         if self.grow_right:
-            total_group = self.group.cards + cards
-        else:
-            total_group = cards + self.group.cards
-        try:
+            return self.group.cards + cards
+        return cards + self.group.cards
+
+    def _get_total_group_extensions(self, cards):
+        total_group = self._get_total_group(cards)
+        if len(total_group) >= MIN_SET_LENGTH:
+            extensions = get_set_extensions(total_group, self.round)
+            if extensions:
+                return extensions
+        if len(total_group) >= MIN_RUN_LENGTH:
+            return get_run_extensions(total_group, self.round)
+        return None
+
+    def _create_total_group(self, cards):
+        total_group = self._get_total_group(cards)
+        if len(total_group) >= MIN_SET_LENGTH and get_set_extensions(total_group, self.round):
             return SetPlay(total_group, self.round)
-        except:
-            try:
-                return RunPlay(total_group, self.round)
-            except:
-                raise Exception("{} is not a valid play in round {}".format(cards, self.round))
+        if len(total_group) >= MIN_RUN_LENGTH and get_run_extensions(total_group, self.round):
+            return RunPlay(total_group, self.round)
+        raise Exception("{} is not a valid play in round {}".format(cards, self.round))
     
     def _calculate_extensions(self):
-        return self._create_total_group(self.cards).get_possible_extensions()
+        return self._get_total_group_extensions(self.cards)
+
+class PublicTable:
+    """
+    The groups played on the table, in the order played, indexed so plays can
+    find their group without comparing it to every other: by position and by
+    cards, sets by value and runs by the cards each end takes. Groups are only
+    ever added or grown, so only append() and extend() add them; call update()
+    after growing one.
+    """
+    groups = None
+    sets = None
+    runs = None
+    _positions = None
+    _by_cards = None
+    _sets_by_value = None
+    _runs_by_end = None
+    _keys = None
+
+    def __init__(self, groups = None):
+        self.groups = []
+        self.sets = []
+        self.runs = []
+        self._positions = {}
+        self._by_cards = {}
+        self._sets_by_value = {}
+        self._runs_by_end = {}
+        self._keys = {}
+        self.extend(groups or [])
+
+    def __iter__(self):
+        return iter(self.groups)
+
+    def __len__(self):
+        return len(self.groups)
+
+    def __getitem__(self, position):
+        return self.groups[position]
+
+    def __eq__(self, other):
+        if isinstance(other, PublicTable):
+            return self.groups == other.groups
+        return self.groups == other
+
+    def __repr__(self):
+        return repr(self.groups)
+
+    def __reduce__(self):
+        # Copies and pickles rebuild the index from the groups, since it's keyed by id().
+        return PublicTable, (self.groups,)
+
+    def append(self, group):
+        self._positions[id(group)] = len(self.groups)
+        self.groups.append(group)
+        if isinstance(group, SetPlay):
+            self.sets.append(group)
+        elif isinstance(group, RunPlay):
+            self.runs.append(group)
+        self._index(group)
+
+    def extend(self, groups):
+        for group in groups:
+            self.append(group)
+
+    def update(self, group):
+        """
+        Re-index a group after its cards changed.
+        """
+        self._unindex(group)
+        self._index(group)
+
+    def position(self, group):
+        """
+        Returns: int where the group, which must be on the table, was played
+        """
+        return self._positions[id(group)]
+
+    def find(self, group):
+        """
+        Returns: Play the first group on the table equal to group, or None
+        """
+        entries = self._by_cards.get(self._get_cards_key(group))
+        return entries[0][1] if entries else None
+
+    def get_set(self, value):
+        """
+        Returns: SetPlay the first set of the value on the table, or None
+        """
+        entries = self._sets_by_value.get(value)
+        return entries[0][1] if entries else None
+
+    def get_set_values(self):
+        """
+        Returns: set(int) values of the sets on the table
+        """
+        return set(self._sets_by_value)
+
+    def get_runs_taking(self, card, grow_right):
+        """
+        Returns: list(RunPlay) runs, in the order played, whose upper end if
+            grow_right, or else lower end, takes the non-wild card
+        """
+        entries = self._runs_by_end.get((card.suit.value, card.value, grow_right), []) + \
+            self._runs_by_end.get((Suits.JOKER.value, card.value, grow_right), [])
+        return [run for _, run in sorted(entries, key = lambda x: x[0])]
+
+    @staticmethod
+    def _get_cards_key(group):
+        # Plays are equal when their class and cards are, and cards when their codes are.
+        return type(group), tuple(card.code for card in group.cards)
+
+    def _index(self, group):
+        entry = (self._positions[id(group)], group)
+        cards_key = self._get_cards_key(group)
+        bisect.insort(self._by_cards.setdefault(cards_key, []), entry)
+        keys = [(self._by_cards, cards_key)]
+        if isinstance(group, SetPlay):
+            # Fixing a set's wilds can change its value, so it's keyed again on every update.
+            value = group.get_possible_extensions().first_value
+            bisect.insort(self._sets_by_value.setdefault(value, []), entry)
+            keys.append((self._sets_by_value, value))
+        elif isinstance(group, RunPlay):
+            for extension, grow_right in zip(group.get_possible_extensions(), [False, True]):
+                if not extension:
+                    continue
+                for value in range(extension.first_value, extension.last_value + 1):
+                    end_key = (extension.suit.value, value, grow_right)
+                    bisect.insort(self._runs_by_end.setdefault(end_key, []), entry)
+                    keys.append((self._runs_by_end, end_key))
+        self._keys[id(group)] = keys
+
+    def _unindex(self, group):
+        entry = (self._positions[id(group)], group)
+        for index, key in self._keys.pop(id(group)):
+            entries = index[key]
+            entries.remove(entry)
+            if not entries:
+                del index[key]
+
+def _get_public_table(public_groups):
+    """
+    Returns: PublicTable public_groups, or a table indexing the same groups
+    if it's a plain list
+    """
+    if isinstance(public_groups, PublicTable):
+        return public_groups
+    return PublicTable(public_groups)
+
+class MeldIndex:
+    """
+    A hand's cards as the meld generators look them up, gathered in one pass
+    so each search position scans the hand once rather than once per
+    generator. Non-wild cards are in (value, suit) order, as get_non_wilds
+    gives them.
+    """
+    round = None
+    wilds = None
+    non_wilds = None
+    unique_non_wilds = None
+    # Non-wild cards of each value held, and how many.
+    cards_by_value = None
+    value_counts = None
+    # Per suit, the unique non-wild cards, their values and a bitboard of them.
+    suit_cards = None
+    suit_values = None
+    suit_masks = None
+
+    def __init__(self, cards, round):
+        self.round = round
+        self.wilds = cards.get_wilds(round)
+        self.non_wilds = cards.get_non_wilds(round)
+        self.unique_non_wilds = []
+        self.cards_by_value = {}
+        self.value_counts = [0] * WILD_VALUE
+        self.suit_cards = [[] for _ in range(SUIT_COUNT)]
+        self.suit_values = [[] for _ in range(SUIT_COUNT)]
+        self.suit_masks = [0] * SUIT_COUNT
+        previous_code = None
+        for card in self.non_wilds:
+            code = card.code
+            suit, value = code >> SUIT_SHIFT, code & VALUE_MASK
+            self.value_counts[value] += 1
+            self.cards_by_value.setdefault(value, []).append(card)
+            if code != previous_code:
+                self.unique_non_wilds.append(card)
+                self.suit_cards[suit].append(card)
+                self.suit_values[suit].append(value)
+                self.suit_masks[suit] |= 1 << value
+            previous_code = code
+
+    def get_suited_above(self, suit, value):
+        """
+        Returns: list(Card) unique non-wild cards of the suit above value, lowest first
+        """
+        return self.suit_cards[suit][bisect.bisect_right(self.suit_values[suit], value):]
+
+    def get_suited_below(self, suit, value):
+        """
+        Returns: list(Card) unique non-wild cards of the suit below value, lowest first
+        """
+        return self.suit_cards[suit][:bisect.bisect_left(self.suit_values[suit], value)]
 
 def get_runs(cards, round, starting_run = None, grow_right = True):
     if starting_run is None:
         starting_run = []
 
-    def remove_card(to_remove):
-        cards_copy = copy.deepcopy(cards)
-        cards_copy.cards.remove(to_remove)
-        return cards_copy
+    # Grow runs against one working copy of the hand, putting cards back on
+    # backtrack.
+    hand = copy.deepcopy(cards)
 
-    if len(starting_run) >= MIN_RUN_LENGTH:
-        yield starting_run
-    
-    lower_extension_cards, upper_extension_cards = RunPlay(starting_run, round, 0).select_possible_extensions_from_hand(cards)
-    if grow_right:
-        for card in upper_extension_cards:
-            yield from get_runs(remove_card(card), round, starting_run + [card], grow_right)
-    else:
-        for card in lower_extension_cards:
-            yield from get_runs(remove_card(card), round, [card] + starting_run, grow_right)
+    def grow_runs(run):
+        if len(run) >= MIN_RUN_LENGTH:
+            yield run
+
+        lower_extension_cards, upper_extension_cards = RunPlay(run, round, 0).select_possible_extensions_from_hand(hand)
+        for card in (upper_extension_cards if grow_right else lower_extension_cards):
+            removed = hand.remove_all([card])
+            yield from grow_runs(run + [card] if grow_right else [card] + run)
+            hand.restore(removed)
+
+    yield from grow_runs(starting_run)
 
 def _expand_sorted_non_wild_run_with_wilds(potential_run, wild_cards, round, minimum_run_length = MIN_RUN_LENGTH):
     if not potential_run:
@@ -543,7 +1040,7 @@ def _expand_sorted_non_wild_run_with_wilds(potential_run, wild_cards, round, min
     if critical_wild_count > len(wild_cards):
         return None
     
-    wild_copy = copy.deepcopy(wild_cards)
+    wild_copy = list(wild_cards)
     def take_n_wilds(n):
         if n <= 0:
             return None
@@ -591,48 +1088,50 @@ def _expand_sorted_non_wild_run_with_wilds(potential_run, wild_cards, round, min
             internal_non_wild_indices.append(k)
     for wilds in range(len(wild_copy) + 1):
         for g in combinations(internal_non_wild_indices, wilds):
-            output_run = copy.deepcopy(potential_run)
+            output_run = list(potential_run)
             for wild_idx, idx in enumerate(g):
-                output_run[idx] = copy.deepcopy(wild_copy[wild_idx])
+                output_run[idx] = wild_copy[wild_idx]
             yield output_run
 
-def get_non_redundant_runs(cards, round):
-    non_wild_cards = sorted(list(set(cards.get_non_wilds(round))))
-    wild_cards = cards.get_wilds(round)
+def get_non_redundant_runs(cards, round, index = None):
+    if index is None:
+        index = MeldIndex(cards, round)
+    wild_cards = index.wilds
 
-    suit_groups = groupby(non_wild_cards, lambda x: x.suit)
-    for _, non_wild_suited in suit_groups:
-        non_wild_suited = sorted(list(non_wild_suited))
+    # Each suit's cards in value order, so no off-suit card splits a run.
+    for non_wild_suited in index.suit_cards:
         for i in range(len(non_wild_suited)):
             for j in range(i, len(non_wild_suited)):
                 yield from _expand_sorted_non_wild_run_with_wilds(non_wild_suited[i:j+1], wild_cards, round)
 
-def get_non_redundant_run_group_extensions(cards, round, group):
+def get_non_redundant_run_group_extensions(cards, round, group, index = None):
+    if index is None:
+        index = MeldIndex(cards, round)
     lower_extension, upper_extension = group.get_possible_extensions()
     group_suit = group.get_suit()
-    non_wild_cards = sorted(list(filter(lambda x: x.suit == group_suit, set(cards.get_non_wilds(round)))))
-    wild_cards = cards.get_wilds(round)
+    wild_cards = index.wilds
     
     possible_upper_extensions = []
     possible_lower_extensions = []
     if upper_extension:
         for top_value in range(upper_extension.first_value - 1, upper_extension.last_value):
-            non_wild_set = list(filter(lambda x: x.value > top_value, non_wild_cards))
+            non_wild_set = index.get_suited_above(group_suit.value, top_value)
             for i in range(1, len(non_wild_set) + 1):
                 for possible_extension in _expand_sorted_non_wild_run_with_wilds([Card(group_suit, top_value)] + non_wild_set[:i], wild_cards, round, 2):
                     possible_upper_extensions.append(possible_extension[1:])
     if lower_extension:
         for bottom_value in range(lower_extension.first_value + 1, lower_extension.last_value + 2):
-            non_wild_set = list(filter(lambda x: x.value < bottom_value, non_wild_cards))
+            non_wild_set = index.get_suited_below(group_suit.value, bottom_value)
             for i in range(0, len(non_wild_set)):
                 for possible_extension in _expand_sorted_non_wild_run_with_wilds(non_wild_set[i:] + [Card(group_suit, bottom_value)], wild_cards, round, 2):
                     possible_lower_extensions.append(possible_extension[:-1])
     
     return possible_lower_extensions, possible_upper_extensions
 
-def get_sets(cards, round, only_maximum_size = False):
-    non_wild_cards = cards.get_non_wilds(round)
-    wild_cards = cards.get_wilds(round)
+def get_sets(cards, round, only_maximum_size = False, index = None):
+    if index is None:
+        index = MeldIndex(cards, round)
+    wild_cards = index.wilds
 
     # Differentiating between wilds is meaningless, so we will not.
     # Return sets that can be made with all wilds.
@@ -642,9 +1141,7 @@ def get_sets(cards, round, only_maximum_size = False):
             yield wild_cards[:i]
 
     # Return all sets with at least one real card.
-    possible_sets = groupby(non_wild_cards, lambda x: x.value)
-    for _, group in possible_sets:
-        possible_set = list(group)
+    for possible_set in index.cards_by_value.values():
         if only_maximum_size and (len(possible_set) + len(wild_cards) >= MIN_SET_LENGTH):
             yield possible_set + wild_cards
         else:
@@ -652,68 +1149,155 @@ def get_sets(cards, round, only_maximum_size = False):
                 for wild_count in range(max(MIN_SET_LENGTH - card_count, 0), len(wild_cards) + 1):
                     yield possible_set[0:card_count] + wild_cards[:wild_count]
 
-def get_non_wild_set_values_on_groups(cards, round, groups):
-    set_groups = filter(lambda x: isinstance(x, SetPlay), groups)
-    all_possible_sets = set([x.get_possible_extensions().first_value for x in set_groups])
-    non_wild_cards = set(map(lambda x: x.value, cards.get_non_wilds(round)))
-    return non_wild_cards.intersection(all_possible_sets)
+def get_non_wild_set_values_on_groups(cards, round, groups, index = None):
+    if index is None:
+        index = MeldIndex(cards, round)
+    return set(index.cards_by_value).intersection(_get_public_table(groups).get_set_values())
 
 def get_all_plays(cards, round, public_groups, line = None):
-    if line is None:
-        line = []
-
-    def remove_cards(to_remove):
-        cards_copy = copy.deepcopy(cards)
-        for card in to_remove:
-            cards_copy.cards.remove(card)
-        return cards_copy
-
-    def add_to_group(cards, target_group, grow_right):
-        groups_copy = copy.deepcopy(public_groups)
-        for group in groups_copy:
-            if target_group == group:
-                group.add_cards(cards, grow_right)
-                group.fix_wilds()
-                return groups_copy
-        raise Exception("Failed to add card to group!")
-    
-    def add_to_line(play):
-        line_copy = copy.deepcopy(line)
-        line_copy.append(play)
-        return line_copy
-    
+    """
+    Yield every (remaining_cards, line) the hand can reach by playing runs, sets
+    and extensions onto public groups.
+
+    The search plays onto a single working copy of the hand, groups and line,
+    undoing each play when it backtracks, so only the yielded results are
+    copied. Plays that don't share cards can be made in either order to the
+    same end, so each combination of them is only yielded in the order
+    searched first.
+    """
+    hand = copy.deepcopy(cards)
+    groups = PublicTable(group.copy() for group in public_groups)
+    yield from _search_all_plays(hand, round, groups, list(line) if line else [], {})
+
+def get_play_signature(play, round, target_index = None):
+    """
+    Canonical key for a candidate play: its kind, the public group it extends
+    and on which end, and its cards with every wild alike, since which wild
+    fills a spot doesn't matter.
+    """
+    grow_right = play.grow_right if isinstance(play, PublicGroupPlay) else None
+    codes = tuple(WILD_CODE if card.is_wild(round) else card.code for card in play.cards)
+    return type(play).__name__, target_index, grow_right, codes
+
+def _plays_commute(first, second, hand_counts):
+    """
+    Whether two plays open from the same position can be made in either order:
+    they extend different public groups, if any, and the hand holds enough
+    cards, counting wilds alike, for both.
+    """
+    first_signature, second_signature = first[0], second[0]
+    if first_signature[1] is not None and first_signature[1] == second_signature[1]:
+        return False
+    first_counts, second_counts = first[1], second[1]
+    return all(count + second_counts.get(code, 0) <= hand_counts.get(code, 0) for code, count in first_counts.items())
+
+def _search_all_plays(hand, round, public_groups, line, asleep):
+    """
+    Args:
+        asleep(dict): plays already searched before this position's line, in
+            another order, keyed by signature; they aren't searched again here
+    """
+    index = MeldIndex(hand, round)
+    candidates = _get_candidate_plays(hand, round, public_groups, index)
+    if candidates:
+        hand_counts = Counter(WILD_CODE if card.is_wild(round) else card.code for card in hand.cards)
+        searched = dict(asleep)
+    for play, group in candidates:
+        signature = get_play_signature(play, round, public_groups.position(group) if group is not None else None)
+        if signature in asleep:
+            continue
+        played = (signature, Counter(signature[3]))
+        # Plays searched before this one that it commutes with were already
+        # followed by it, so they aren't searched after it.
+        child_asleep = {key: other for key, other in searched.items() if _plays_commute(other, played, hand_counts)}
+        undo = _apply_play(hand, public_groups, play, group)
+        line.append(play)
+        yield from _search_all_plays(hand, round, public_groups, line, child_asleep)
+        line.pop()
+        _undo_play(hand, undo)
+        searched[signature] = played
+
+    yield _play_out(hand, round, public_groups, line, index)
+
+def _get_candidate_plays(hand, round, public_groups, index = None):
+    """
+    List the plays to branch on from this position, in search order.
+    Args:
+        index(MeldIndex): the hand's index, if already built
+    Returns: list((Play, Play)) each play with the public group it extends, or None
+    """
+    if index is None:
+        index = MeldIndex(hand, round)
+    public_groups = _get_public_table(public_groups)
+    candidates = []
+
     # We can't be greedy here.
-    for run in get_non_redundant_runs(cards, round):
-        yield from get_all_plays(remove_cards(run), round, public_groups, add_to_line(RunPlay(run, round)))
+    for run in get_non_redundant_runs(hand, round, index):
+        candidates.append((RunPlay(run, round), None))
 
-    run_groups = list(filter(lambda x: isinstance(x, RunPlay), public_groups))
-    if (run_groups):
+    if (public_groups.runs):
         # Check all subplays on group runs first.
         # We can't be greedy here either.
-        for group in run_groups:
-            lower_extensions, upper_extensions = get_non_redundant_run_group_extensions(cards, round, group)
+        for group in public_groups.runs:
+            lower_extensions, upper_extensions = get_non_redundant_run_group_extensions(hand, round, group, index)
 
             for extension in lower_extensions:
-                yield from get_all_plays(remove_cards(extension), round, add_to_group(extension, group, False), add_to_line(PublicGroupPlay(extension, round, group, False)))
+                candidates.append((PublicGroupPlay(extension, round, group.copy(), False), group))
             for extension in upper_extensions:
-                yield from get_all_plays(remove_cards(extension), round, add_to_group(extension, group, True), add_to_line(PublicGroupPlay(extension, round, group, True)))
+                candidates.append((PublicGroupPlay(extension, round, group.copy(), True), group))
 
     # We can be greedy here.
-    for set in get_sets(cards, round, True):
-        yield from get_all_plays(remove_cards(set), round, public_groups, add_to_line(SetPlay(set, round)))
-
+    for set in get_sets(hand, round, True, index):
+        candidates.append((SetPlay(set, round), None))
+
+    return candidates
+
+def _apply_play(hand, public_groups, play, target_group):
+    """
+    Play onto the working hand and groups.
+    Args:
+        public_groups(PublicTable): the working groups
+        target_group(Play): the group in public_groups the play extends, if any
+    Returns: undo record for _undo_play()
+    """
+    group_undo = None
+    if target_group is not None:
+        group_undo = (public_groups, target_group, list(target_group.cards), target_group._extensions)
+        target_group.add_cards(play.cards, play.grow_right)
+        target_group.fix_wilds()
+        public_groups.update(target_group)
+    return hand.remove_all(play.cards), group_undo
+
+def _undo_play(hand, undo):
+    removed, group_undo = undo
+    hand.restore(removed)
+    if group_undo:
+        public_groups, group, group.cards, group._extensions = group_undo
+        public_groups.update(group)
+
+def _play_out(cards, round, public_groups, line, index = None):
+    """
+    Finish a line by greedily playing whatever is left onto public sets and
+    wilds onto the line's runs.
+    Args:
+        index(MeldIndex): the hand's index, if already built
+    Returns: (Hand, list(Play)) copies of the remaining cards and line
+    """
     # At this point, we can play out any cards we have, including wilds, onto public groups.
     # We can continue to be greedy here.
     remaining_cards = copy.deepcopy(cards)
+    line = [play.copy() for play in line]
 
     # Try and play on existing sets.
-    set_groups = list(filter(lambda x: isinstance(x, SetPlay), public_groups))
-    wilds = cards.get_wilds(round)
-    if set_groups:
-        for value in get_non_wild_set_values_on_groups(cards, round, set_groups):
-           group = next(filter(lambda x: x.cards[0].value == value, set_groups))
-           cards_to_play = list(filter(lambda x: x.value == value, cards.get_non_wilds(round)))
-           line.append(PublicGroupPlay(cards_to_play, round, group, True))
+    public_groups = _get_public_table(public_groups)
+    if index is None:
+        index = MeldIndex(cards, round)
+    wilds = list(index.wilds)
+    if public_groups.sets:
+        for value in get_non_wild_set_values_on_groups(cards, round, public_groups, index):
+           group = public_groups.get_set(value)
+           cards_to_play = list(index.cards_by_value[value])
+           line.append(PublicGroupPlay(cards_to_play, round, group.copy(), True))
            for card in cards_to_play:
                remaining_cards.remove(card)
 
@@ -736,8 +1320,439 @@ def get_all_plays(cards, round, public_groups, line = None):
         if not add_wild_to_plays(wilds.pop()):
             break
 
-    yield remaining_cards, line
+    return remaining_cards, line
+
+def _get_play_out_score(cards, round, public_groups, index = None):
+    """
+    Score left in hand once _play_out has played onto public sets. Leftover
+    wilds score nothing, so this doesn't depend on the line.
+    """
+    if index is None:
+        index = MeldIndex(cards, round)
+    score = cards.get_score(round)
+    public_groups = _get_public_table(public_groups)
+    if public_groups.sets:
+        for value in get_non_wild_set_values_on_groups(cards, round, public_groups, index):
+            score -= min(value, 10) * index.value_counts[value]
+    return score
+
+def get_hand_signature(cards, round, public_groups):
+    """
+    Canonical key for a search position: the multiset of cards in hand, the
+    round and the cards in each public group.
+    """
+    group_signature = tuple((isinstance(group, RunPlay), tuple(card.code for card in group.cards)) for group in public_groups)
+    return round, tuple(sorted(card.code for card in cards.cards)), group_signature
+
+class TranspositionTable:
+    """
+    Bounded cache of solved search positions, evicting the least recently used.
+    """
+    max_size = None
+    hits = 0
+    misses = 0
+    _entries = None
+
+    def __init__(self, max_size = 200000):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last = False)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+def get_dead_cards(cards, round, public_groups, index = None):
+    """
+    Find the non-wild cards that can't join any run, set or public group from
+    this position. Playing never makes another card playable, so these are
+    left over on every line.
+    Args:
+        index(MeldIndex): the hand's index, if already built
+    Returns: list(int) codes of the dead cards
+    """
+    # This runs at every search position, so it works on card codes directly.
+    if index is None:
+        index = MeldIndex(cards, round)
+    wild_count = len(index.wilds)
+    value_counts = index.value_counts
+    suit_masks = list(index.suit_masks)
+    if wild_count >= MIN_SET_LENGTH - 1:
+        # Any card can make a set with the wilds.
+        return []
+
+    public_groups = _get_public_table(public_groups)
+    set_values = public_groups.get_set_values()
+    for group in public_groups.runs:
+        first_card = group._get_first_represented_card()
+        if first_card.suit == Suits.JOKER:
+            # An all-wild run could be extended in any suit.
+            return []
+        suit_masks[first_card.suit.value] |= ((1 << len(group.cards)) - 1) << first_card.value
+
+    window = (1 << MIN_RUN_LENGTH) - 1
+    dead_cards = []
+    for card in index.non_wilds:
+        code = card.code
+        suit, value = code >> SUIT_SHIFT, code & VALUE_MASK
+        if value_counts[value] + wild_count >= MIN_SET_LENGTH or value in set_values:
+            continue
+        suit_mask = suit_masks[suit]
+        for first_value in range(max(1, value - MIN_RUN_LENGTH + 1), min(value, 14 - MIN_RUN_LENGTH) + 1):
+            if MIN_RUN_LENGTH - bin(suit_mask >> first_value & window).count("1") <= wild_count:
+                break
+        else:
+            dead_cards.append(code)
+    return dead_cards
+
+def get_score_lower_bound(cards, round, public_groups, index = None):
+    """
+    Admissible bound on the score get_all_plays can leave in hand: the score of
+    the dead cards, which are left over on every line.
+    """
+    return sum(min(code & VALUE_MASK, 10) for code in get_dead_cards(cards, round, public_groups, index))
+
+class SearchTimeout(Exception):
+    """
+    Raised inside a PlaySolver search once its deadline has passed.
+    """
+    pass
+
+class PlaySolver:
+    """
+    Finds the lowest scoring (remaining_cards, line) of get_all_plays.
+
+    Positions are solved once and stored in a TranspositionTable, so reaching
+    the same sub-hand through a different order of plays (run A then set B,
+    or set B then run A) reuses the stored result instead of searching again.
+    It doesn't put plays asleep as _search_all_plays does: a position searched
+    with plays asleep isn't solved exactly, so it couldn't be stored, and the
+    table lookups that reordering costs here are cheaper than that.
+    The search is branch-and-bound: a branch is dropped as soon as
+    get_score_lower_bound shows it can't beat the best line found so far,
+    which also ends the search once a line scores 0. Ties go to the line
+    get_all_plays would have yielded first.
+
+    Given a deadline, the solver searches lines of one play, then two, and so
+    on, keeping the best line of the last search to finish, so it always has
+    an answer when the deadline passes. The clock is checked at every
+    position searched.
+
+    With after_discard, a line scores what the player keeps once the turn's
+    discard takes the highest scoring card left, so lines that go out score 0.
+    """
+    round = None
+    table = None
+    deadline = None
+    after_discard = False
+    truncations = 0
+
+    def __init__(self, round, table = None, deadline = None, after_discard = False):
+        """
+        Args:
+            deadline(float): time.perf_counter() time to stop searching by, if any
+            after_discard(bool): score lines as left after the turn's discard
+        """
+        self.round = round
+        self.table = table if table is not None else TranspositionTable()
+        self.deadline = deadline
+        self.after_discard = after_discard
+        self.truncations = 0
+
+    def solve(self, cards, public_groups):
+        """
+        Returns: (Hand, list(Play)) the best remaining cards and line. With a
+        deadline this is the best line found in time, the exact one if the
+        search finished.
+        """
+        hand = copy.deepcopy(cards)
+        groups = PublicTable(group.copy() for group in public_groups)
+        if self.deadline is None:
+            _, line = self._get_best_line(hand, groups, float("inf"))
+        else:
+            line = self._deepen(hand, groups)
+        return self._replay(hand, groups, line)
+
+    def _replay(self, hand, groups, line):
+        # Replay the best line so the result matches get_all_plays exactly.
+        for play in line:
+            _apply_play(hand, groups, play, self._get_target_group(play, groups))
+        return _play_out(hand, self.round, groups, line)
+
+    def _get_target_group(self, play, groups):
+        if isinstance(play, PublicGroupPlay):
+            return groups.find(play.group)
+        return None
 
-def check_go_out(hand, round, groups):
-    best_play = sorted(list(get_all_plays(hand, round, groups)), key = lambda x: x[0].get_score(round))[0]
-    return best_play[0] == 0
\ No newline at end of file
+    def _deepen(self, hand, groups):
+        """
+        Search again with one more play allowed each time, until a search
+        isn't cut short by the depth or the deadline passes. Each search starts
+        from copies, since a search stopped by the deadline doesn't undo its
+        plays.
+        Returns: list(Play) the line of the deepest search finished in time
+        """
+        best_line = []
+        depth = 0
+        try:
+            while True:
+                truncations = self.truncations
+                _, best_line = self._get_best_line(copy.deepcopy(hand), PublicTable(group.copy() for group in groups), float("inf"), depth)
+                if self.truncations == truncations:
+                    break
+                depth += 1
+        except SearchTimeout:
+            pass
+        return best_line
+
+    def _get_best_line(self, hand, groups, limit, depth = None):
+        """
+        Results are only stored once the whole search below them has run, so
+        the table only holds exact results.
+        Args:
+            limit(int): only lines scoring below this are wanted
+            depth(int): most plays a line may have, unlimited if None
+        Returns: (int, list(Play)) best remaining score from this position and
+        the plays that reach it, or (int, None) with a lower bound on the
+        score if nothing scores below limit
+        """
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+        key = get_hand_signature(hand, self.round, groups)
+        if self.after_discard:
+            # Scored differently, so kept apart in a shared table.
+            key += ("after_discard",)
+        entry = self.table.get(key)
+        if entry is not None:
+            score, line = entry
+            if score >= limit:
+                return score, None
+            if line is not None:
+                return entry
+
+        index = MeldIndex(hand, self.round)
+        lower_bound = self._get_lower_bound(hand, groups, index)
+        if lower_bound >= limit:
+            return lower_bound, None
+
+        # The play out is yielded after every deeper line, so a deeper line
+        # that ties it wins.
+        play_out_score = self._get_play_out_score(hand, groups, index)
+        candidates = _get_candidate_plays(hand, self.round, groups, index)
+        if depth is not None and depth <= 0:
+            if candidates:
+                self.truncations += 1
+            return (play_out_score, []) if play_out_score < limit else (limit, None)
+
+        truncations = self.truncations
+        child_depth = depth - 1 if depth is not None else None
+        child_limit = min(limit, play_out_score + 1)
+        best = None
+        for play, group in candidates:
+            undo = _apply_play(hand, groups, play, group)
+            score, line = self._get_best_line(hand, groups, child_limit, child_depth)
+            _undo_play(hand, undo)
+            if line is not None:
+                best = (score, [play] + line)
+                child_limit = min(limit, score)
+                if score <= lower_bound:
+                    break
+
+        if best is None and play_out_score < limit:
+            best = (play_out_score, [])
+        complete = self.truncations == truncations
+        if best is None:
+            # Nothing here beats the limit; remember that for later searches.
+            if complete:
+                self.table.put(key, (limit, None))
+            return limit, None
+
+        if complete:
+            self.table.put(key, best)
+        return best
+
+    def _get_lower_bound(self, hand, groups, index):
+        if not self.after_discard:
+            return get_score_lower_bound(hand, self.round, groups, index)
+        # Dead cards are left on every line and the discard takes one card, so
+        # all but the highest of them are kept; more than one rules going out.
+        dead_scores = [min(code & VALUE_MASK, 10) for code in get_dead_cards(hand, self.round, groups, index)]
+        return sum(dead_scores) - max(dead_scores, default = 0)
+
+    def _get_play_out_score(self, hand, groups, index):
+        score = _get_play_out_score(hand, self.round, groups, index)
+        if self.after_discard:
+            # Cards of public sets are played out; the highest of the rest goes.
+            set_values = get_non_wild_set_values_on_groups(hand, self.round, groups, index)
+            score -= max((min(card.value, 10) for card in index.non_wilds if card.value not in set_values), default = 0)
+        return score
+
+def find_best_play(cards, round, public_groups, table = None, deadline = None, after_discard = False):
+    """
+    Args:
+        deadline(float): time.perf_counter() time to stop searching by, if any
+        after_discard(bool): score lines by what is left after the turn's
+            discard, rather than before it
+    Returns: (Hand, list(Play)) the lowest scoring result of get_all_plays, or
+        the best found by the deadline
+    """
+    return PlaySolver(round, table, deadline, after_discard).solve(cards, public_groups)
+
+def find_go_out_play(cards, round, public_groups, table = None, deadline = None):
+    """
+    Find a line that goes out: one leaving at most one card, which the turn's
+    discard then takes. The lowest scoring line can leave more cards than one
+    that goes out, so players look for this before settling for it.
+    Args:
+        deadline(float): time.perf_counter() time to stop searching by, if any
+    Returns: (Hand, list(Play)) a line that goes out, or None if there isn't
+        one, or none was found by the deadline
+    """
+    solver = PlaySolver(round, table, deadline, after_discard = True)
+    hand = copy.deepcopy(cards)
+    groups = PublicTable(group.copy() for group in public_groups)
+    # Only lines scoring 0 after the discard go out.
+    try:
+        _, line = solver._get_best_line(hand, groups, 1)
+    except SearchTimeout:
+        return None
+    if line is None:
+        return None
+    best_play = solver._replay(hand, groups, line)
+    # A full run can't take a leftover wild after all.
+    return best_play if len(best_play[0].cards) <= 1 else None
+
+def find_best_play_with_draw(cards, card, round, public_groups, table = None, deadline = None):
+    """
+    Find the best play for the hand with a card drawn, and from the same
+    search the best play for the hand as it is where possible: if the best
+    line leaves the drawn card over, that line is still the best without it.
+    Returns: ((Hand, list(Play)), (Hand, list(Play))) best play with the card,
+        and without it or None if that needs its own search
+    """
+    hand = copy.deepcopy(cards)
+    hand.add(card)
+    with_card = find_best_play(hand, round, public_groups, table, deadline)
+    if deadline is not None:
+        # A line found by the deadline may not be the best, so nothing follows
+        # from it for the hand without the card.
+        return with_card, None
+    without_remaining = copy.deepcopy(with_card[0])
+    if not without_remaining.remove(card):
+        return with_card, None
+    return with_card, (without_remaining, list(with_card[1]))
+
+def get_unseen_card_counts(known_cards, deck_count = 2):
+    """
+    Args:
+        known_cards(list(Card)): cards seen in hand, on the table or discarded
+        deck_count(int): number of decks in play
+    Returns: list(int) how many of each card code haven't been seen
+    """
+    counts = [0] * CARD_CODE_COUNT
+    for card in Deck(deck_count).cards:
+        counts[card.code] += 1
+    for card in known_cards:
+        # A fixed wild is still the wild card itself.
+        code = card.wild_card.code if card.is_fixed else card.code
+        counts[code] = max(counts[code] - 1, 0)
+    return counts
+
+def get_expected_draw_score(cards, round, public_groups, unseen_counts, table = None):
+    """
+    Expected score left after the best play if the hand draws a card at random
+    from the unseen ones. Cards that can't join any meld don't need a search:
+    they add no melds, so they score the hand's own best play plus the card.
+    Args:
+        unseen_counts(list(int)): result of get_unseen_card_counts
+    Returns: float expected score, or None if there is nothing left to draw
+    """
+    solver = PlaySolver(round, table)
+    hand = copy.deepcopy(cards)
+    hand_score = None
+    total_count = 0
+    total_score = 0
+    for code, count in enumerate(unseen_counts):
+        if not count:
+            continue
+        card = CARDS_BY_CODE[code]
+        hand.add(card)
+        if code in get_dead_cards(hand, round, public_groups):
+            if hand_score is None:
+                hand_score = solver.solve(cards, public_groups)[0].get_score(round)
+            score = hand_score + card.get_score(round)
+        else:
+            score = solver.solve(hand, public_groups)[0].get_score(round)
+        hand.remove(card)
+        total_count += count
+        total_score += count * score
+    return total_score / total_count if total_count else None
+
+def choose_discard(cards, round, public_groups, table = None, best_play = None, deadline = None):
+    """
+    Pick the discard that leaves the hand the lowest scoring best play.
+
+    Discarding a card the best line leaves over keeps that line, so the
+    highest scoring leftover is the best of those without a search. A card
+    the line plays can only do better if it scores more than that leftover,
+    since the hand without it can't score below the hand's own best minus the
+    card: every meld of the smaller hand is still a meld of the hand. Only
+    those cards are searched, bounded by the best discard so far, against one
+    shared table.
+    Args:
+        best_play((Hand, list(Play))): the hand's best play, if already known
+        deadline(float): time.perf_counter() time to stop searching by; the
+            best discard found by then is returned
+    Returns: Card the card to discard, or None for an empty hand
+    """
+    if not cards.cards:
+        return None
+    solver = PlaySolver(round, table, deadline)
+    if best_play is None:
+        best_play = solver.solve(cards, public_groups)
+    hand_score = best_play[0].get_score(round)
+    discard = best_play[0].get_highest_value_card(round)
+    best_score = hand_score - discard.get_score(round) if discard else float("inf")
+
+    played_cards = set()
+    for play in best_play[1]:
+        played_cards.update(card.wild_card if card.is_fixed else card for card in play.cards)
+    hand = copy.deepcopy(cards)
+    groups = PublicTable(group.copy() for group in public_groups)
+    for card in sorted(played_cards, key = lambda x: x.get_score(round), reverse = True):
+        if hand_score - card.get_score(round) >= best_score:
+            break
+        removed = hand.remove_all([card])
+        try:
+            score, line = solver._get_best_line(hand, groups, best_score)
+        except SearchTimeout:
+            break
+        hand.restore(removed)
+        if line is not None:
+            best_score = score
+            discard = card
+    return discard
+
+def check_go_out(hand, round, groups, table = None):
+    best_play = find_best_play(hand, round, groups, table)
+    return best_play[0].get_score(round) == 0
\ No newline at end of file
@@ -0,0 +1,102 @@
+import json
+from datastructures import *
+
+# Message logged for each game event, filled in from the event's fields.
+EVENT_MESSAGES = {
+    "game_start": "Starting game with players: %(players)s, seed: %(seed)s",
+    "game_end": "Game over, player scores: %(scores)s",
+    "round_start": "Round %(round)s beginning. First player: %(player)s",
+    "round_end": "Round %(round)s over, player scores: %(scores)s",
+    "deal": "%(player)s dealt: %(hand)s",
+    "upcard": "Starting discard pile with: %(card)s",
+    "turn": "------------ Turn: %(turn)s, player: %(player)s ------------ %(hand)s, %(score)s",
+    "draw": "Drawing from %(source)s: %(card)s",
+    "deck_empty": "Deck empty! Returning discard draw instead.",
+    "play": "%(player)s playing %(line)s",
+    "go_out": "%(player)s going out with play %(line)s",
+    "first_out": "First player to go out: %(player)s",
+    "out_score": "Score: %(score)s, Hand: %(hand)s",
+    "public_groups": "Public cards: %(groups)s",
+    "deck_exhausted": "Each player has had a turn with the deck empty, ending the game.",
+    "discard": "Discarding: %(card)s",
+    "score": "Final round %(round)s score for player %(player)s: %(round_score)s; player total score: %(score)s",
+}
+
+def to_record(value):
+    """
+    Convert an event field to plain JSON values: cards become their codes, a
+    wild fixed to a value becomes {"wild": code, "as": code}, and hands and
+    plays become lists of cards.
+    """
+    if isinstance(value, FixedCard):
+        return {"wild": value.wild_card.code, "as": value.code}
+    if isinstance(value, Card):
+        return value.code
+    if isinstance(value, (Hand, Play)):
+        return [to_record(card) for card in value.cards]
+    if isinstance(value, dict):
+        return {key: to_record(field) for key, field in value.items()}
+    if isinstance(value, (list, tuple, PublicTable)):
+        return [to_record(field) for field in value]
+    return value
+
+class LoggingSink:
+    """
+    Writes events as log messages. Messages are only formatted when the logger
+    would emit them.
+    """
+    logger = None
+    level = None
+
+    def __init__(self, logger = None, level = logging.INFO):
+        self.logger = logger or logging.getLogger()
+        self.level = level
+
+    def record(self, event, fields):
+        if self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, EVENT_MESSAGES[event], fields)
+
+class JsonlSink:
+    """
+    Writes each event as one line of JSON to a file, as a record of the game.
+    """
+    file = None
+
+    def __init__(self, file):
+        self.file = file
+
+    def record(self, event, fields):
+        record = to_record(fields)
+        record["event"] = event
+        self.file.write(json.dumps(record))
+        self.file.write("\n")
+
+class EventLog:
+    """
+    Sends game events to every sink listening. An EventLog without sinks is
+    silent, and callers check `enabled` before building costly fields.
+    """
+    sinks = None
+    enabled = False
+
+    def __init__(self, sinks = None):
+        self.sinks = list(sinks or [])
+        self.enabled = bool(self.sinks)
+
+    @classmethod
+    def silent(cls):
+        return cls()
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+        self.enabled = True
+
+    def emit(self, event, **fields):
+        for sink in self.sinks:
+            sink.record(event, fields)
+
+def get_default_event_log():
+    """
+    Returns: EventLog that logs events at INFO level, as games always have
+    """
+    return EventLog([LoggingSink()])
@@ -1,17 +1,29 @@
 import argparse
+import time
 from datastructures import *
-from time import time
+from events import *
 
 class Player:
     score = 0
     hand = None
     is_out = False
     name = None
-    def __init__(self, name):
+    transposition_table = None
+    # Best play for the hand as it stands, and the public groups it was found
+    # against. Kept up to date across turns where that's cheap.
+    best_play = None
+    best_play_groups = None
+    # Milliseconds each turn's searches may take between them, unlimited if
+    # None, and the time.perf_counter() time the current turn's run out.
+    move_budget_ms = None
+    move_deadline = None
+    def __init__(self, name, move_budget_ms = None):
         self.name = name
         self.score = 0
         self.is_out = False
-        self.hand = Hand()
+        self.hand = BitboardHand()
+        self.transposition_table = TranspositionTable()
+        self.move_budget_ms = move_budget_ms
     
     def reset(self):
         self.score = 0
@@ -20,9 +32,32 @@ class Player:
     def new_round(self):
         self.hand.clear()
         self.is_out = False
+        # Positions from the last round can't come up again.
+        self.transposition_table.clear()
+        self.best_play = None
 
-    def draw_card(self, card):
+    def draw_card(self, card, round = None):
         self.hand.add(card)
+        if self.best_play is None:
+            return
+        # A card that can't join any meld is left over on every line, so the
+        # best line stays the same with that card left over too.
+        if round is not None and self.best_play_groups == self._get_groups_state(round.public_groups) and card.code in get_dead_cards(self.hand, round.round_number, round.public_groups):
+            self.best_play[0].add(card)
+        else:
+            self.best_play = None
+
+    def discarded(self, card):
+        """
+        Called once a discarded card has left the hand.
+        """
+        if self.best_play is None:
+            return
+        # Any line left the card over, so the best line doesn't need it and is
+        # still the best once it's gone.
+        if card is not None and self.best_play[0].remove(card):
+            return
+        self.best_play = None
 
     def should_draw_from_discard(self, round):
         return False, None
@@ -31,40 +66,103 @@ class Player:
         return self.hand.discard_highest_value(round.round_number)
     
     def determine_play(self, hand, round):
-        def check_score(hand):
-            highest_value_card = hand.get_highest_value_card(round.round_number)
-            if highest_value_card:
-                return hand.get_score(round.round_number) - highest_value_card.value
-            else:
-                return hand.get_score(round.round_number)
-        best_play = sorted(self._search_for_n_seconds(hand, round, 5), key = lambda x: check_score(x[0]))[0]
-        return best_play
+        return self._get_turn_play(hand, round, self.get_best_play(hand, round))
+
+    def get_best_play(self, hand, round):
+        """
+        Lowest scoring play for the hand, kept across turns for the player's
+        own hand.
+        Returns: (Hand, list(Play))
+        """
+        groups_state = self._get_groups_state(round.public_groups)
+        # Plays found by a deadline may not be the best, so they aren't kept.
+        if hand is not self.hand or self.move_deadline is not None:
+            return find_best_play(hand, round.round_number, round.public_groups, self.transposition_table, self.move_deadline)
+        if self.best_play is None or self.best_play_groups != groups_state:
+            self.best_play = find_best_play(hand, round.round_number, round.public_groups, self.transposition_table)
+            self.best_play_groups = groups_state
+        return self.best_play
+
+    def _get_turn_play(self, hand, round, best_play):
+        """
+        The lowest scoring line isn't always the one to play. Players go out by
+        leaving at most one card, so they look for a line that does. Once
+        someone is out the line is played and the highest card discarded, so
+        lines are scored by what that leaves.
+        Returns: (Hand, list(Play)) the line to play this turn
+        """
+        if len(best_play[0].cards) <= 1:
+            return best_play
+        if round.public_groups:
+            return find_best_play(hand, round.round_number, round.public_groups, self.transposition_table, self.move_deadline, after_discard = True)
+        go_out_play = find_go_out_play(hand, round.round_number, round.public_groups, self.transposition_table, self.move_deadline)
+        return go_out_play if go_out_play is not None else best_play
+
+    def determine_draw_play(self, card, round):
+        """
+        The line the player would play if it drew the card, without drawing
+        it. Uses, or fills in from the same search, the best play for the hand
+        itself, so the draw that follows can often skip its search.
+        Returns: (Hand, list(Play))
+        """
+        groups_state = self._get_groups_state(round.public_groups)
+        potential_hand = copy.deepcopy(self.hand)
+        potential_hand.add(card)
+        if self.best_play is not None and self.best_play_groups == groups_state and card.code in get_dead_cards(potential_hand, round.round_number, round.public_groups):
+            remaining = copy.deepcopy(self.best_play[0])
+            remaining.add(card)
+            with_card = (remaining, list(self.best_play[1]))
+        else:
+            with_card, without_card = find_best_play_with_draw(self.hand, card, round.round_number, round.public_groups, self.transposition_table, self.move_deadline)
+            if without_card is not None:
+                self.best_play = without_card
+                self.best_play_groups = groups_state
+        return self._get_turn_play(potential_hand, round, with_card)
+
+    def get_expected_deck_draw_score(self, round):
+        """
+        Expected score left after the best play if the player draws from the
+        deck, counting every card not in hand, on the table or discarded as
+        equally likely.
+        Returns: float
+        """
+        known_cards = list(self.hand.cards) + list(round.discard_pile.cards)
+        for group in round.public_groups:
+            known_cards.extend(group.cards)
+        unseen_counts = get_unseen_card_counts(known_cards, round.deck_count)
+        return get_expected_draw_score(self.hand, round.round_number, round.public_groups, unseen_counts, self.transposition_table)
+
+    @staticmethod
+    def _get_groups_state(public_groups):
+        # Groups are only ever added to or grown, so this changes whenever they do.
+        return len(public_groups), sum(len(group.cards) for group in public_groups)
 
     def play_turn(self, round):
+        if self.move_budget_ms is not None:
+            self.move_deadline = time.perf_counter() + self.move_budget_ms / 1000
         draw_discard, determined_play = self.should_draw_from_discard(round)
 
         if (draw_discard):
-            self.draw_card(round.draw_from_discard())
+            self.draw_card(round.draw_from_discard(), round)
         else:
-            self.draw_card(round.draw_from_deck())
+            self.draw_card(round.draw_from_deck(), round)
             determined_play = self.determine_play(self.hand, round)
 
         if round.player_is_out() or len(determined_play[0].cards) <= 1:
             self._play(determined_play, round)
         
-        round.discard(self.discard(round))
+        discard = self.discard(round)
+        self.discarded(discard)
+        round.discard(discard)
 
     def commit_score(self, round):
         this_round_score = self.hand.get_score(round.round_number)
         self.score += this_round_score
-        logging.info("Final round {} score for player {}: {}; player total score: {}".format(round.round_number, self.name, this_round_score, self.score))
+        round.events.emit("score", round = round.round_number, player = self.name, round_score = this_round_score, score = self.score)
 
     def _play(self, play, round):
         going_out = not round.player_is_out()
-        if going_out:
-            logging.info("{} going out with play {}".format(self.name, play[1]))
-        else:
-            logging.info("{} playing {}".format(self.name, play[1]))
+        round.events.emit("go_out" if going_out else "play", player = self.name, line = play[1])
         new_public_groups = []
         for move in play[1]:
             move.fix_wilds(round.round_number)
@@ -72,17 +170,7 @@ class Player:
         if going_out:
             round.public_groups.extend(new_public_groups)
         self.is_out = True
-
-    def _search_for_n_seconds(self, hand, round, n):
-        start = time()
-        found_plays = []
-        for play in get_all_plays(hand, round.round_number, round.public_groups):
-            found_plays.append(play)
-
-            # Stop the search early if we found a good enough solution
-            if time() - start >= n or len(play[0].cards) <= 1:
-                return found_plays
-        return found_plays
+        self.best_play = None
 
     def __repr__(self):
         return "{}: {}, {}".format(self.name, self.hand, self.score)
@@ -96,11 +184,15 @@ class Round:
     # Cards on the table that all can play on
     public_groups = []
     turns_deck_empty = 0
+    deck_count = 0
+    events = None
 
-    def __init__(self, player_list, round, deck_count=2):
+    def __init__(self, player_list, round, deck_count=2, seed=None, events=None):
         """
         Args:
             player_list(list(string)): list of string player names. Ordered by turn order.
+            seed(random.Random|int|None): generator or seed used to shuffle the deck
+            events(EventLog): where the round reports what happens, logged if None
         """
         if round < 3 or round > 13:
             raise Exception("Round must be between 3 and 13")
@@ -108,14 +200,16 @@ class Round:
             raise Exception("Must have at least 2 players")
         
         self.round_number = round
-        self.public_groups = []
+        self.deck_count = deck_count
+        self.public_groups = PublicTable()
         self.player_list = player_list
         self.turn_index = 0
         self.turns_deck_empty = 0
+        self.events = events if events is not None else get_default_event_log()
 
-        logging.info("Round {} beginning. First player: {}".format(round, player_list[self.turn_index]))
+        self.events.emit("round_start", round = round, player = player_list[self.turn_index].name)
         
-        self.deck = Deck(deck_count)
+        self.deck = Deck(deck_count, seed)
         self.deck.shuffle()
         self.discard_pile = DiscardPile()
         
@@ -124,13 +218,13 @@ class Round:
 
         for _ in range(0, round):
             for player in player_list:
-                player.draw_card(self.draw_from_deck())
-
-        self.discard_pile.add(self.draw_from_deck())
+                player.draw_card(self.deck.deal())
+        for player in player_list:
+            self.events.emit("deal", player = player.name, hand = player.hand)
 
-    def print_state(self):
-        for player in self.player_list:
-            logging.info(player)
+        upcard = self.deck.deal()
+        self.events.emit("upcard", card = upcard)
+        self.discard_pile.add(upcard)
 
     def player_is_out(self):
         return bool(self.public_groups)
@@ -141,20 +235,20 @@ class Round:
     def draw_from_deck(self):
         card = self.deck.deal()
         if card:
-            logging.info("Drawing from deck: {}".format(card))
+            self.events.emit("draw", source = "deck", card = card)
         else:
-            logging.info("Deck empty! Returning discard draw instead.")
+            self.events.emit("deck_empty")
             return self.draw_from_discard()
         return card
 
     def draw_from_discard(self):
         card = self.discard_pile.pop()
-        logging.info("Drawing from discard: {}".format(card))
+        self.events.emit("draw", source = "discard", card = card)
         return card
     
     def discard(self, card):
         if card:
-            logging.info("Discarding: {}".format(card))
+            self.events.emit("discard", card = card)
             self.discard_pile.add(card)
 
     def play(self):
@@ -162,8 +256,7 @@ class Round:
         Returns true if the round is over, false if not
         """
         current_player = self.get_current_player()
-        logging.info("------------ Turn: {}, player: {} ------------".format(self.turn_index, current_player.name))
-        logging.info(current_player)
+        self.events.emit("turn", turn = self.turn_index, player = current_player.name, hand = current_player.hand, score = current_player.score)
 
         someone_out = bool(self.public_groups)
         current_player.play_turn(self)
@@ -176,23 +269,21 @@ class Round:
         first_to_go_out = not someone_out and current_player.is_out
         
         if first_to_go_out:
-            logging.info("First player to go out: {}".format(current_player))
+            self.events.emit("first_out", player = current_player.name)
 
-        # We are out either way in this case.
-        if first_to_go_out or someone_out:
-            logging.info("Score: {}, Hand: {}".format(current_player.hand.get_score(self.round_number), current_player.hand.cards))
+        # We are out either way in this case. The score is only reported, so
+        # don't walk the hand for it every turn when nobody is listening.
+        if (first_to_go_out or someone_out) and self.events.enabled:
+            self.events.emit("out_score", player = current_player.name, score = current_player.hand.get_score(self.round_number), hand = current_player.hand)
 
-        # If there are public groups modified, that means someone has gone out. Log them.
-        if first_to_go_out:
-            for group in self.public_groups:
-                logging.debug("Playing initial public group: {}".format(group))
+        # If there are public groups, that means someone has gone out. Log them.
         if self.player_is_out():
-            logging.info("Public cards:\n{}".format(self.public_groups))
+            self.events.emit("public_groups", groups = self.public_groups)
         
         deck_empty_too_long = self.turns_deck_empty > len(self.player_list)
         if all(map(lambda x: x.is_out, self.player_list)) or deck_empty_too_long:
             if deck_empty_too_long:
-                logging.info("Each player has had a turn with the deck empty, ending the game.")
+                self.events.emit("deck_exhausted")
             for player in self.player_list:
                 player.commit_score(self)
             return True
@@ -205,19 +296,28 @@ class Round:
         Returns score map
         """
         round_over = False
-        self.print_state()
         while not round_over:
             round_over = self.play()
 
 class Game:
     player_list = []
     deck_count = 0
+    random = None
+    seed = None
+    events = None
 
-    def __init__(self, players, deck_count=2):
+    def __init__(self, players, deck_count=2, seed=None, events=None):
         """
         Args:
             player_list(list(string)): list of string player names
+            seed(random.Random|int|None): generator or seed for every round's deal
+            events(EventLog): where the game reports what happens, logged if None.
+                EventLog.silent() skips all of it.
         """
+        self.random = get_random(seed)
+        # Only an int seed can be recorded to replay the game from.
+        self.seed = seed if isinstance(seed, int) else None
+        self.events = events if events is not None else get_default_event_log()
         self.player_list = []
         for player in players:
             self.player_list.append(player)
@@ -225,16 +325,17 @@ class Game:
         self.deck_count = deck_count
 
     def play_round(self, round_number):
-        round = Round(self.player_list, round_number, self.deck_count)
-        logging.info("======================= ROUND START {} =======================".format(round_number))
+        round = Round(self.player_list, round_number, self.deck_count, self.random, self.events)
         round.play_until_round_over()
-        logging.info("======================= ROUND OVER  {} =======================".format(round_number))
-        logging.info("Round {} over, player scores:\n{}".format(round_number, list(map(lambda x: x.score, self.player_list))))
+        if self.events.enabled:
+            self.events.emit("round_end", round = round_number, scores = [player.score for player in self.player_list])
 
     def play(self):
-        logging.info("Starting game with players: {}".format(self.player_list))
+        self.events.emit("game_start", players = [player.name for player in self.player_list], seed = self.seed)
         for round in range(3,14):
             self.play_round(round)
+        if self.events.enabled:
+            self.events.emit("game_end", scores = [player.score for player in self.player_list])
     
     
 
@@ -248,7 +349,7 @@ def run_script():
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Test playground')
     
-    logging.getLogger().setLevel(logging.INFO)
+    logging.basicConfig(level=logging.INFO)
 
     args = parser.parse_args()
     print(args)
@@ -0,0 +1,247 @@
+import mmap
+import struct
+from events import *
+
+REPLAY_MAGIC = b"RUMR"
+REPLAY_VERSION = 1
+REPLAY_HEADER = REPLAY_MAGIC + bytes([REPLAY_VERSION])
+# Each event is its code and the length of its payload, then the payload.
+EVENT_HEADER = struct.Struct("<BH")
+U16 = struct.Struct("<H")
+U64 = struct.Struct("<Q")
+# Card codes fit in 7 bits, so a set high bit marks a wild fixed to a value,
+# and the fixed card's code follows in the next byte.
+FIXED_CARD_FLAG = 0x80
+DRAW_SOURCES = ["deck", "discard"]
+
+# Fields recorded for each event, in order. Events are coded by their position
+# here, so only ever append to this. Fields a replay can rebuild, such as the
+# hand at each turn and the public groups, aren't recorded.
+EVENT_FIELDS = {
+    "game_start": [("players", "names"), ("seed", "seed")],
+    "game_end": [("scores", "scores")],
+    "round_start": [("round", "u8"), ("player", "player")],
+    "round_end": [("round", "u8"), ("scores", "scores")],
+    "deal": [("player", "player"), ("hand", "cards")],
+    "upcard": [("card", "card")],
+    "turn": [("turn", "u16"), ("player", "player"), ("score", "u16")],
+    "draw": [("source", "source"), ("card", "card")],
+    "deck_empty": [],
+    "play": [("player", "player"), ("line", "line")],
+    "go_out": [("player", "player"), ("line", "line")],
+    "first_out": [("player", "player")],
+    "out_score": [("player", "player"), ("score", "u16")],
+    "deck_exhausted": [],
+    "discard": [("card", "card")],
+    "score": [("round", "u8"), ("player", "player"), ("round_score", "u16"), ("score", "u16")],
+}
+REPLAY_EVENTS = list(EVENT_FIELDS)
+EVENT_CODES = {event: code for code, event in enumerate(REPLAY_EVENTS)}
+
+def _pack_card(payload, card):
+    if card.is_fixed:
+        payload.append(FIXED_CARD_FLAG | card.wild_card.code)
+    payload.append(card.code)
+
+def _unpack_card(data, position):
+    code = data[position]
+    if code & FIXED_CARD_FLAG:
+        return {"wild": code & ~FIXED_CARD_FLAG, "as": data[position + 1]}, position + 2
+    return code, position + 1
+
+def _unpack_cards(data, position):
+    cards = []
+    count = data[position]
+    position += 1
+    for _ in range(count):
+        card, position = _unpack_card(data, position)
+        cards.append(card)
+    return cards, position
+
+class ReplaySink:
+    """
+    Event sink that writes a compact binary replay of each game: the seed, the
+    deal, every draw, discard and play as card codes, and the scores.
+    """
+    file = None
+    players = None
+
+    def __init__(self, file, header = True):
+        """
+        Args:
+            file: binary file to write to
+            header(bool): start the file with the replay header. Leave it off
+                when the output is appended to a file that already has one.
+        """
+        self.file = file
+        self.players = []
+        if header:
+            file.write(REPLAY_HEADER)
+
+    def record(self, event, fields):
+        if event not in EVENT_CODES:
+            return
+        if event == "game_start":
+            self.players = list(fields["players"])
+        payload = bytearray()
+        for name, kind in EVENT_FIELDS[event]:
+            self._pack(payload, kind, fields[name])
+        self.file.write(EVENT_HEADER.pack(EVENT_CODES[event], len(payload)))
+        self.file.write(payload)
+
+    def _pack(self, payload, kind, value):
+        if kind == "u8":
+            payload.append(value)
+        elif kind == "u16":
+            payload += U16.pack(value)
+        elif kind == "player":
+            payload.append(self.players.index(value))
+        elif kind == "source":
+            payload.append(DRAW_SOURCES.index(value))
+        elif kind == "card":
+            _pack_card(payload, value)
+        elif kind == "cards":
+            cards = value.cards if isinstance(value, Hand) else value
+            payload.append(len(cards))
+            for card in cards:
+                _pack_card(payload, card)
+        elif kind == "line":
+            payload.append(len(value))
+            for play in value:
+                self._pack(payload, "cards", play.cards)
+        elif kind == "scores":
+            payload.append(len(value))
+            for score in value:
+                payload += U16.pack(score)
+        elif kind == "names":
+            payload.append(len(value))
+            for name in value:
+                encoded = name.encode("utf-8")
+                payload.append(len(encoded))
+                payload += encoded
+        elif kind == "seed":
+            if value is None:
+                payload.append(0)
+            else:
+                payload.append(1)
+                payload += U64.pack(value)
+        else:
+            raise Exception("Unknown replay field kind: {}".format(kind))
+
+class ReplayReader:
+    """
+    Reads games back from a replay. Events decode to the same plain values as
+    to_record gives: cards are codes and players are names.
+    """
+    data = None
+
+    def __init__(self, data):
+        """
+        Args:
+            data(bytes): contents of a replay file, or a memory map of one
+        """
+        if data[:len(REPLAY_HEADER)] != REPLAY_HEADER:
+            raise Exception("Not a version {} rummy replay".format(REPLAY_VERSION))
+        self.data = data
+
+    @classmethod
+    def open(cls, path):
+        """
+        Memory map a replay file, so only the parts read are loaded.
+        """
+        with open(path, "rb") as replay_file:
+            return cls(mmap.mmap(replay_file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def index(self):
+        """
+        Find every game without decoding its turns.
+        Returns: list(dict) the offset, players, seed and final scores of each game
+        """
+        games = []
+        game_start = EVENT_CODES["game_start"]
+        game_end = EVENT_CODES["game_end"]
+        position = len(REPLAY_HEADER)
+        while position < len(self.data):
+            code, length = EVENT_HEADER.unpack_from(self.data, position)
+            if code == game_start:
+                game = self._decode(code, position + EVENT_HEADER.size, [])
+                game["offset"] = position
+                game["scores"] = None
+                games.append(game)
+            elif code == game_end and games:
+                # A replay cut mid-game ends a game it never started; skip it.
+                games[-1]["scores"] = self._decode(code, position + EVENT_HEADER.size, [])["scores"]
+            position += EVENT_HEADER.size + length
+        return games
+
+    def events(self, offset = None):
+        """
+        Yield (string, dict) each event and its fields, from offset on.
+        """
+        position = len(REPLAY_HEADER) if offset is None else offset
+        players = []
+        while position < len(self.data):
+            code, length = EVENT_HEADER.unpack_from(self.data, position)
+            fields = self._decode(code, position + EVENT_HEADER.size, players)
+            if code == EVENT_CODES["game_start"]:
+                players = fields["players"]
+            yield REPLAY_EVENTS[code], fields
+            position += EVENT_HEADER.size + length
+
+    def read_game(self, offset):
+        """
+        Args:
+            offset(int): where the game starts, as given by index
+        Returns: list((string, dict)) the game's events
+        """
+        game = []
+        for event, fields in self.events(offset):
+            if event == "game_start" and game:
+                break
+            game.append((event, fields))
+            if event == "game_end":
+                break
+        return game
+
+    def _decode(self, code, position, players):
+        data = self.data
+        fields = {}
+        for name, kind in EVENT_FIELDS[REPLAY_EVENTS[code]]:
+            if kind == "u8" or kind == "player" or kind == "source":
+                value = data[position]
+                position += 1
+                if kind == "player":
+                    value = players[value]
+                elif kind == "source":
+                    value = DRAW_SOURCES[value]
+            elif kind == "u16":
+                value = U16.unpack_from(data, position)[0]
+                position += U16.size
+            elif kind == "card":
+                value, position = _unpack_card(data, position)
+            elif kind == "cards":
+                value, position = _unpack_cards(data, position)
+            elif kind == "line":
+                value = []
+                count = data[position]
+                position += 1
+                for _ in range(count):
+                    cards, position = _unpack_cards(data, position)
+                    value.append(cards)
+            elif kind == "scores":
+                count = data[position]
+                value = [U16.unpack_from(data, position + 1 + i * U16.size)[0] for i in range(count)]
+                position += 1 + count * U16.size
+            elif kind == "names":
+                value = []
+                count = data[position]
+                position += 1
+                for _ in range(count):
+                    length = data[position]
+                    value.append(bytes(data[position + 1:position + 1 + length]).decode("utf-8"))
+                    position += 1 + length
+            elif kind == "seed":
+                value = U64.unpack_from(data, position + 1)[0] if data[position] else None
+                position += 1 + (U64.size if data[position] else 0)
+            fields[name] = value
+        return fields
@@ -1,20 +1,62 @@
 import argparse
+import io
+import json
+import os
 from game import *
+from replay import *
 
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from itertools import combinations
-from random import shuffle
 from tqdm import tqdm
 from tqdm.contrib.logging import logging_redirect_tqdm
 import numpy as np
 
+# Glicko's scale factor between rating points and the logistic curve, and the
+# deviation a new player starts with.
+GLICKO_Q = np.log(10) / 400
+BASE_DEVIATION = 350.0
+
 class Elo:
+    """
+    Ratings kept in arrays indexed by player, with every match logged so
+    confidence intervals can be bootstrapped from it. With use_variance,
+    recordMatches rates like Glicko, tracking how sure each rating is.
+    """
     base_rating = 1000
+    # Player name to index into the rating arrays.
     players = None
-    def __init__(self):
+    names = None
+    ratings = None
+    deviations = None
+    k = None
+    use_variance = False
+    _initial_ratings = None
+    _match_log = None
+    # Matches in each rating period, in the order they were rated.
+    _period_lengths = None
+
+    def __init__(self, k = None, use_variance = False):
+        """
+        Args:
+            k(float): most a rating moves in one match; 42 per player if None
+            use_variance(bool): rate with Glicko deviations rather than a fixed k
+        """
         self.players = {}
+        self.names = []
+        self.ratings = np.zeros(0)
+        self.deviations = np.zeros(0)
+        self.k = k
+        self.use_variance = use_variance
+        self._initial_ratings = []
+        self._match_log = ([], [], [])
+        self._period_lengths = []
 
     def getPlayerRating(self, name):
-        return self.players[name]
+        return self.ratings[self.players[name]]
+
+    def getRatingDeviation(self, name):
+        return self.deviations[self.players[name]]
 
     def contains(self, name):
         return name in self.players.keys()
@@ -23,86 +65,321 @@ class Elo:
         if rating == None:
             rating = self.base_rating
 
-        self.players[name] = rating
+        if name in self.players:
+            self.ratings[self.players[name]] = rating
+            return
+        self.players[name] = len(self.names)
+        self.names.append(name)
+        self._initial_ratings.append(rating)
+        self.ratings = np.append(self.ratings, float(rating))
+        self.deviations = np.append(self.deviations, BASE_DEVIATION)
 
     def _compare_rating(self, first, second):
         return (1 + 10 ** ((second - first) / 400.0 )) ** -1
 
+    def _get_k(self):
+        return self.k if self.k is not None else len(self.players.keys()) * 42
 
     def recordMatch(self, name1, name2, winner=None):
-        ratings = np.array([self.getPlayerRating(name1), self.getPlayerRating(name2)])
-        expected = np.array([self._compare_rating(ratings[0], ratings[1]),
-                             self._compare_rating(ratings[1], ratings[0])])
-        
-        k = len(self.players.keys()) * 42
-
         if not winner:
-            scores = np.array([0.5, 0.5])
+            score = 0.5
         elif winner == name1:
-            scores = np.array([1.0, 0.0])
+            score = 1.0
         elif winner == name2:
-            scores = np.array([0.0, 1.0])
+            score = 0.0
         else:
             raise Exception("Invalid winner supplied {}".format(winner))
+        self.recordMatches([name1], [name2], [score])
+
+    def recordMatches(self, names1, names2, scores):
+        """
+        Rate many matches at once, each against the ratings from before any of
+        them, as one rating period.
+        Args:
+            names1(list(string)): first player of each match
+            names2(list(string)): second player of each match
+            scores(list(float)): first player's score in each match: 1 for a
+                win, 0.5 for a draw and 0 for a loss
+        """
+        first = np.array([self.players[name] for name in names1], dtype=int)
+        second = np.array([self.players[name] for name in names2], dtype=int)
+        scores = np.asarray(scores, dtype=float)
+        for log, values in zip(self._match_log, [first, second, scores]):
+            log.extend(values.tolist())
+        self._period_lengths.append(len(scores))
+        self.ratings, self.deviations = self._rate(self.ratings, self.deviations, first, second, scores)
+
+    def _rate(self, ratings, deviations, first, second, scores):
+        """
+        Rate one period of matches between the players at the given indexes.
+        Returns: (np.ndarray, np.ndarray) the new ratings and deviations
+        """
+        if self.use_variance:
+            return self._rate_with_variance(ratings, deviations, first, second, scores)
+
+        k = self._get_k()
+        deltas = np.zeros(len(ratings))
+        np.add.at(deltas, first, k * (scores - self._compare_rating(ratings[first], ratings[second])))
+        np.add.at(deltas, second, k * ((1 - scores) - self._compare_rating(ratings[second], ratings[first])))
+        return np.maximum(ratings + deltas, 0), deviations
+
+    def _rate_with_variance(self, ratings, deviations, first, second, scores):
+        """
+        Glicko update for one rating period. Deviations only shrink here; they
+        don't grow back between periods.
+        """
+        # Each match, seen from both players' sides.
+        players = np.concatenate([first, second])
+        opponents = np.concatenate([second, first])
+        scores = np.concatenate([scores, 1 - scores])
 
-        new_ratings = ratings + k * (scores - expected)
+        g = 1 / np.sqrt(1 + 3 * GLICKO_Q ** 2 * deviations[opponents] ** 2 / np.pi ** 2)
+        expected = 1 / (1 + 10 ** (-g * (ratings[players] - ratings[opponents]) / 400))
+        information = np.zeros(len(ratings))
+        gain = np.zeros(len(ratings))
+        np.add.at(information, players, GLICKO_Q ** 2 * g ** 2 * expected * (1 - expected))
+        np.add.at(gain, players, g * (scores - expected))
 
-        if new_ratings[0] < 0:
-            new_ratings = np.array([0, np.diff(ratings)])
-        if new_ratings[1] < 0:
-            new_ratings = np.array([np.diff(ratings.flip()), 0])
+        precision = 1 / deviations ** 2 + information
+        return ratings + GLICKO_Q / precision * gain, np.sqrt(1 / precision)
 
-        self.players[name1], self.players[name2] = new_ratings
+    def getConfidenceIntervals(self, samples = 1000, confidence = 0.95, seed = None):
+        """
+        Bootstrap each player's rating: replay matches drawn with replacement
+        from the log, in rating periods the size of the logged ones, and rate
+        them the way recordMatches does. Samples are rated all at once, each
+        one's players at their own offset in one long array.
+        Args:
+            samples(int): resampled tournaments to rate
+            confidence(float): fraction of the samples each interval covers
+        Returns: dict(string, (float, float)) each player's interval
+        """
+        first, second, scores = (np.array(log) for log in self._match_log)
+        player_count = len(self.names)
+        ratings = np.tile(np.array(self._initial_ratings, dtype=float), samples)
+        deviations = np.full(len(ratings), BASE_DEVIATION)
+        if len(scores):
+            offsets = (np.arange(samples) * player_count)[:, np.newaxis]
+            rng = np.random.default_rng(seed)
+            for period_length in self._period_lengths:
+                pick = rng.integers(0, len(scores), size = (samples, period_length))
+                ratings, deviations = self._rate(ratings, deviations, (first[pick] + offsets).ravel(), (second[pick] + offsets).ravel(), scores[pick].ravel())
+        tail = (1 - confidence) / 2 * 100
+        low, high = np.percentile(ratings.reshape(samples, player_count), [tail, 100 - tail], axis = 0)
+        return {name: (low[index], high[index]) for name, index in self.players.items()}
 
     def getRatingList(self):
         ratings = []
-        for player, rating in self.players.items():
-            ratings.append((player, rating))
+        for player, index in self.players.items():
+            ratings.append((player, self.ratings[index]))
         return ratings
 
 class SlightlyBetterPlayer(Player):
     def should_draw_from_discard(self, round):
         potential_draw = round.discard_pile.peek()
-        potential_hand = Hand()
-        potential_hand.cards = copy.deepcopy(self.hand.cards)
-        potential_hand.add(potential_draw)
-
-        potential_play = self.determine_play(potential_hand, round)
+        if potential_draw is None:
+            return False, None
+        potential_play = self.determine_draw_play(potential_draw, round)
         
         return len(potential_play[0].cards) <= 1, potential_play
 
+    def discard(self, round):
+        discard = choose_discard(self.hand, round.round_number, round.public_groups, self.transposition_table, self.get_best_play(self.hand, round), self.move_deadline)
+        self.hand.remove(discard)
+        return discard
+
+def play_game(players, seed, verbose = False, record = False, replay = False):
+    """
+    Play one game, in this process or a worker.
+    Args:
+        players(list(Player)): players in turn order
+        seed(int): seed for the game's deals
+        verbose(bool): log every turn of the game
+        record(bool): keep a JSONL record of the game's events
+        replay(bool): keep a binary replay of the game, without a header
+    Returns: (list((string, int)), string, bytes) each player's name and final
+        score, and the game's record and replay if asked for
+    """
+    events = get_default_event_log() if verbose else EventLog.silent()
+    game_record = io.StringIO() if record else None
+    game_replay = io.BytesIO() if replay else None
+    if record:
+        events.add_sink(JsonlSink(game_record))
+    if replay:
+        events.add_sink(ReplaySink(game_replay, header = False))
+    rummy = Game(players, 2, seed, events)
+    rummy.play()
+    scores = [(player.name, player.score) for player in players]
+    return scores, game_record.getvalue() if record else None, game_replay.getvalue() if replay else None
+
+def read_results(path):
+    """
+    Read a results file written by run_script. A line cut short by the run
+    being killed mid-write is ignored.
+    Returns: (dict, list(dict), int) the tournament line, each finished game's
+        line and the size of the file up to the end of the last whole line
+    """
+    header = None
+    games = []
+    size = 0
+    with open(path, "rb") as results_file:
+        for line in results_file:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                result = json.loads(line)
+            except ValueError:
+                break
+            size += len(line)
+            if result["event"] == "tournament":
+                header = result
+            elif result["event"] == "game":
+                games.append(result)
+    if header is None:
+        raise Exception("{} is not a tournament results file".format(path))
+    return header, games, size
+
+def _truncate(path, size):
+    """
+    Cut an output file back to what the last finished game left, dropping
+    anything written after it.
+    """
+    if size is not None and os.path.exists(path):
+        with open(path, "r+b") as output_file:
+            output_file.truncate(size)
+
 def run_script(args):
-    all_players = [Player("Abe"), Player("Brenna"), SlightlyBetterPlayer("CardBot")]
+    all_players = [Player("Abe", args.move_budget_ms), Player("Brenna", args.move_budget_ms), SlightlyBetterPlayer("CardBot", args.move_budget_ms)]
     all_matchups = list(map(list, combinations(all_players, 2)))
+    player_names = [player.name for player in all_players]
 
     elo = Elo()
     for player in all_players:
         elo.addPlayer(player.name)
 
+    finished_games = []
+    if args.resume:
+        if not args.results:
+            raise Exception("--resume needs the --results file to resume from")
+        header, finished_games, results_size = read_results(args.results)
+        _truncate(args.results, results_size)
+        if args.seed is not None and args.seed != header["seed"]:
+            raise Exception("Tournament in {} was run with seed {}, not {}".format(args.results, header["seed"], args.seed))
+        if header["num_games"] != args.num_games or header["players"] != player_names:
+            raise Exception("Tournament in {} was run with {} games between {}".format(args.results, header["num_games"], header["players"]))
+        args.seed = header["seed"]
+
+    # Every game's order and deal comes from the tournament seed, so results
+    # don't depend on how many workers play them.
+    seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+    tournament_random = random.Random(seed)
     games = []
     for matchup in all_matchups:
         for i in range(args.num_games):
-            if random.randint(0, 1):
-                matchup.reverse()
-            games.append(matchup)
-    shuffle(games)
-
-    logging.critical("Starting tournament between players {}".format(list(map(lambda x: x.name, all_players))))
-    for players in tqdm(games):
-        rummy = Game(players, 2)
-        rummy.play()
-        scores = sorted(players, key = lambda x: x.score)
-        winner = scores[0].name if scores[0].score != scores[1].score else None
-        logging.critical("Recording match {}: winner {}".format(players, winner))
-        elo.recordMatch(*map(lambda x: x.name, players), winner = winner)
+            if tournament_random.randint(0, 1):
+                games.append(list(reversed(matchup)))
+            else:
+                games.append(list(matchup))
+    tournament_random.shuffle(games)
+    game_seeds = [tournament_random.getrandbits(32) for _ in games]
+
+    # Rebuild the ratings from the games already played, in the order played.
+    for result in finished_games:
+        elo.recordMatch(*result["players"], winner = result["winner"])
+    first_game = len(finished_games)
+    if finished_games:
+        logging.critical("Resuming after {} of {} games".format(first_game, len(games)))
+    if args.resume:
+        # Before any game finished, only the replay's header is kept.
+        last_game = finished_games[-1] if finished_games else {"record_end": 0, "replay_end": len(REPLAY_HEADER)}
+        if args.record:
+            _truncate(args.record, last_game.get("record_end"))
+        if args.replay:
+            replay_end = last_game.get("replay_end")
+            if replay_end is not None and os.path.exists(args.replay) and os.path.getsize(args.replay) < replay_end:
+                # A header cut short is written again from the start.
+                replay_end = 0
+            _truncate(args.replay, replay_end)
+
+    logging.critical("Starting tournament between players {} with seed {}".format(player_names, seed))
+    executor = ProcessPoolExecutor(args.workers) if args.workers > 1 else None
+    # Resumed runs add to the files the first run started.
+    mode = "a" if args.resume else "w"
+    results_file = open(args.results, mode) if args.results else None
+    record_file = open(args.record, mode) if args.record else None
+    replay_file = open(args.replay, mode + "b") if args.replay else None
+    if results_file and not args.resume:
+        results_file.write(json.dumps({"event": "tournament", "seed": seed, "num_games": args.num_games, "players": player_names}))
+        results_file.write("\n")
+        results_file.flush()
+    if replay_file and replay_file.tell() == 0:
+        replay_file.write(REPLAY_HEADER)
+    try:
+        # Results come back in game order whichever worker finishes first.
+        play = partial(play_game, verbose = args.verbose, record = bool(record_file), replay = bool(replay_file))
+        remaining_games, remaining_seeds = games[first_game:], game_seeds[first_game:]
+        results = executor.map(play, remaining_games, remaining_seeds) if executor else map(play, remaining_games, remaining_seeds)
+        for game_index, (result, game_record, game_replay) in enumerate(tqdm(results, total = len(games), initial = first_game), first_game):
+            scores = sorted(result, key = lambda x: x[1])
+            winner = scores[0][0] if scores[0][1] != scores[1][1] else None
+            logging.info("Recording match %s: winner %s", result, winner)
+            names = list(map(lambda x: x[0], result))
+            ratings_before = [elo.getPlayerRating(name) for name in names]
+            elo.recordMatch(*names, winner = winner)
+            game_result = {
+                "event": "game",
+                "game": game_index,
+                "seed": game_seeds[game_index],
+                "players": names,
+                "scores": [score for _, score in result],
+                "winner": winner,
+                "rating_changes": [elo.getPlayerRating(name) - before for name, before in zip(names, ratings_before)],
+            }
+            if record_file:
+                record_file.write(json.dumps({"event": "tournament_game", "game": game_index, "seed": game_seeds[game_index]}))
+                record_file.write("\n")
+                record_file.write(game_record)
+                record_file.flush()
+                game_result["record_end"] = record_file.tell()
+            if replay_file:
+                replay_file.write(game_replay)
+                replay_file.flush()
+                game_result["replay_end"] = replay_file.tell()
+            # The game's result goes last, so a game is only counted as
+            # played once everything it wrote is on disk.
+            if results_file:
+                results_file.write(json.dumps(game_result))
+                results_file.write("\n")
+                results_file.flush()
+    finally:
+        if executor:
+            executor.shutdown()
+        if results_file:
+            results_file.close()
+        if record_file:
+            record_file.close()
+        if replay_file:
+            replay_file.close()
 
     logging.critical(elo.getRatingList())
+    if args.bootstrap_samples:
+        intervals = elo.getConfidenceIntervals(args.bootstrap_samples, seed = seed)
+        logging.critical("95% rating intervals: {}".format({name: (round(low), round(high)) for name, (low, high) in intervals.items()}))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Test playground')
     parser.add_argument('--num_games', type=int, default=10, help='The number of games to be pair-wise played between players')
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes to play games in')
+    parser.add_argument('--seed', type=int, default=None, help='Tournament seed; the same seed replays the same games and ratings')
+    parser.add_argument('--verbose', action='store_true', help='Log every turn of every game')
+    parser.add_argument('--record', default=None, help='JSONL file to record every game\'s events to')
+    parser.add_argument('--replay', default=None, help='Binary replay file to record every game to')
+    parser.add_argument('--results', default=None, help='JSONL file to append each game\'s scores and rating changes to as it finishes')
+    parser.add_argument('--resume', action='store_true', help='Carry on the tournament in the --results file, skipping the games it already has')
+    parser.add_argument('--bootstrap_samples', type=int, default=0, help='Resampled tournaments to bootstrap rating intervals from, 0 to skip')
+    parser.add_argument('--move_budget_ms', type=float, default=None, help='Milliseconds each player may search for per turn. Games then depend on timing, so seeds no longer replay them exactly')
     
-    logging.getLogger().setLevel(logging.INFO)
+    logging.basicConfig(level=logging.INFO)
 
     args = parser.parse_args()
     with logging_redirect_tqdm():
@@ -0,0 +1,376 @@
+import argparse
+import time
+from datastructures import *
+from itertools import combinations
+
+import numpy as np
+
+# Card codes of one full deck, in the order Deck builds them.
+DECK_CODES = np.array([card.code for card in Deck(1).cards], dtype=np.int16)
+VALUE_COUNT = 1 << SUIT_SHIFT
+# Lowest value a run can start on so it still fits below the king.
+LAST_RUN_START = 14 - MIN_RUN_LENGTH
+# Cards get_fewest_run_wilds lets runs leave out: the one left in hand and a
+# pair that a set takes with wilds.
+RUN_SKIPS = 4
+# Smaller hands are checked one by one faster than get_fewest_run_wilds
+# rules them out.
+FEWEST_RUN_WILDS_HAND_SIZE = 8
+
+def get_code_tables(round):
+    """
+    Returns: (np.ndarray, np.ndarray) whether each card code is wild in the
+        round, and what it scores left in hand
+    """
+    codes = np.arange(CARD_CODE_COUNT)
+    values = codes & VALUE_MASK
+    is_wild = (values == round) | (values == WILD_VALUE) | (codes >> SUIT_SHIFT == Suits.JOKER.value)
+    scores = np.where(is_wild, 0, np.minimum(values, 10))
+    return is_wild, scores
+
+def _get_meld_support(hands, round):
+    """
+    For each card, how many cards of its value the hand holds and the most
+    cards of any run window through it, ignoring wilds.
+    Returns: (np.ndarray, np.ndarray, np.ndarray, np.ndarray) whether each card
+        is wild, wilds per hand, value counts and best window counts per card
+    """
+    is_wild, _ = get_code_tables(round)
+    wild = is_wild[hands]
+    wild_count = wild.sum(axis=1)
+    present = np.zeros((len(hands), SUIT_COUNT, VALUE_COUNT), dtype=np.int8)
+    counts = np.zeros((len(hands), VALUE_COUNT), dtype=np.int8)
+    rows = np.repeat(np.arange(len(hands)), hands.shape[1])
+    suits = (hands >> SUIT_SHIFT).ravel()
+    values = (hands & VALUE_MASK).ravel()
+    non_wild = ~wild.ravel()
+    present[rows[non_wild], suits[non_wild], values[non_wild]] = 1
+    np.add.at(counts, (rows[non_wild], values[non_wild]), 1)
+
+    # Cards present in each run window, for windows starting at 1..LAST_RUN_START.
+    windows = sum(present[:, :, start:start + LAST_RUN_START] for start in range(1, MIN_RUN_LENGTH + 1))
+    best_window = np.zeros((len(hands), SUIT_COUNT, VALUE_COUNT), dtype=np.int8)
+    for offset in range(MIN_RUN_LENGTH):
+        # A card of value v is in the windows starting at v - offset.
+        first, last = 1 + offset, LAST_RUN_START + 1 + offset
+        np.maximum(best_window[:, :, first:last], windows[:, :, :LAST_RUN_START], out=best_window[:, :, first:last])
+
+    card_values = hands & VALUE_MASK
+    card_rows = np.arange(len(hands))[:, None]
+    return wild, wild_count, counts[card_rows, card_values], best_window[card_rows, hands >> SUIT_SHIFT, card_values]
+
+def count_dead_cards(hands, round, support = None):
+    """
+    Vectorized get_dead_cards on an empty table: how many non-wild cards in
+    each hand can't join any run or set.
+    Args:
+        hands(np.ndarray): card codes, one hand per row
+        round(int): round number, which sets the wild value
+        support(tuple): _get_meld_support of the hands, if already found
+    Returns: np.ndarray dead card count per hand
+    """
+    wild, wild_count, value_counts, window_counts = support if support is not None else _get_meld_support(hands, round)
+    needed = MIN_SET_LENGTH - wild_count[:, None]
+    dead_count = (~wild & (value_counts < needed) & (window_counts < needed)).sum(axis=1)
+    # Any card can make a set with two wilds.
+    dead_count[wild_count >= MIN_SET_LENGTH - 1] = 0
+    return dead_count
+
+def get_fewest_run_wilds(hands, round):
+    """
+    A bound on the wilds a hand's runs need. Cards of a value held fewer than
+    three times can't make a set without wilds, so they go in runs unless
+    left out. Runs here may share cards, so no line needs fewer wilds.
+    Args:
+        hands(np.ndarray): card codes, one hand per row
+        round(int): round number, which sets the wild value
+    Returns: np.ndarray fewest wilds per hand for runs holding all of those
+        cards but j, for j below RUN_SKIPS
+    """
+    count = len(hands)
+    is_wild, _ = get_code_tables(round)
+    wild = is_wild[hands]
+    rows = np.repeat(np.arange(count), hands.shape[1])
+    non_wild = ~wild.ravel()
+    copies = np.zeros((count, SUIT_COUNT, VALUE_COUNT), dtype=np.int8)
+    np.add.at(copies, (rows[non_wild], (hands >> SUIT_SHIFT).ravel()[non_wild], (hands & VALUE_MASK).ravel()[non_wild]), 1)
+    needs_run = copies * (copies.sum(axis=1) < MIN_SET_LENGTH)[:, None, :]
+    # Suited cards held with values up to each value.
+    held_below = np.zeros((count, SUIT_COUNT, VALUE_COUNT), dtype=np.int8)
+    np.cumsum(copies[:, :, 1:WILD_VALUE] > 0, axis=2, dtype=np.int8, out=held_below[:, :, 1:WILD_VALUE])
+
+    # fewest[:, suit, j, value]: fewest wilds for runs holding the suit's
+    # cards below value, leaving out j of them.
+    unreachable = np.iinfo(np.int8).max // 2
+    fewest = np.full((count, SUIT_COUNT, RUN_SKIPS, WILD_VALUE + 1), unreachable, dtype=np.int8)
+    fewest[:, :, 0, 1] = 0
+    for value in range(1, WILD_VALUE):
+        current = fewest[..., value]
+        # Leaving out fewer cards is always allowed.
+        np.minimum.accumulate(current, axis=2, out=current)
+        # Pass the value by, leaving out any of its cards that need a run.
+        left_out = needs_run[:, :, value, None]
+        passed = current
+        for cards_left_out in range(1, needs_run.max(initial = 0) + 1):
+            shifted = np.full_like(current, unreachable)
+            shifted[..., cards_left_out:] = current[..., :-cards_left_out]
+            passed = np.where(left_out == cards_left_out, shifted, passed)
+        np.minimum(fewest[..., value + 1], passed, out=fewest[..., value + 1])
+        # Or start a run here, ending on any value at least two above.
+        first_last = value + MIN_RUN_LENGTH - 1
+        if first_last < WILD_VALUE:
+            lengths = np.arange(MIN_RUN_LENGTH, WILD_VALUE - value + 1)
+            gaps = lengths - (held_below[:, :, first_last:WILD_VALUE] - held_below[:, :, value - 1, None])
+            ends = fewest[..., first_last + 1:]
+            np.minimum(ends, current[..., None] + gaps[:, :, None, :], out=ends)
+    suit_fewest = np.minimum.accumulate(fewest[..., WILD_VALUE].astype(np.int16), axis=2)
+
+    # Spread the cards left out over the suits.
+    total = suit_fewest[:, 0]
+    for suit in range(1, SUIT_COUNT):
+        combined = np.full((count, RUN_SKIPS), unreachable * SUIT_COUNT, dtype=np.int16)
+        for skips in range(RUN_SKIPS):
+            for suit_skips in range(skips + 1):
+                np.minimum(combined[:, skips], total[:, skips - suit_skips] + suit_fewest[:, suit, suit_skips], out=combined[:, skips])
+        total = combined
+    return total
+
+def might_go_out(hands, round):
+    """
+    Rule out, in bulk, hands that can't go out on an empty table.
+
+    Going out leaves at most one card, and dead cards are left over on every
+    line. Cards that can't join a meld without wilds need one: a meld with w
+    wilds holds at most 2 * (w + 1) of them, runs with gaps being the best
+    case, so the hand's wilds can place at most 4 per wild. Large hands that
+    pass are checked against get_fewest_run_wilds: besides the card left
+    over, only a set that takes wilds, at least one, holds cards runs leave
+    out.
+    Returns: np.ndarray bool per hand
+    """
+    support = _get_meld_support(hands, round)
+    wild, wild_count, value_counts, window_counts = support
+    needs_wild = (~wild & (value_counts < MIN_SET_LENGTH) & (window_counts < MIN_RUN_LENGTH)).sum(axis=1)
+    result = (count_dead_cards(hands, round, support) <= 1) & (needs_wild <= 4 * wild_count + 1)
+    rows = np.flatnonzero(result)
+    if len(rows) and hands.shape[1] >= FEWEST_RUN_WILDS_HAND_SIZE:
+        # Past the card left in hand, cards runs leave out need a set's wilds.
+        set_wilds = (np.arange(RUN_SKIPS) > 1).astype(int)
+        result[rows] = (get_fewest_run_wilds(hands[rows], round) + set_wilds <= wild_count[rows, None]).any(axis=1)
+    return result
+
+def _get_run_choices(first_value, values, wild_count):
+    """
+    Runs in one suit whose lowest card is first_value, drawn from the values
+    above it, as get_non_redundant_runs makes them: any of the cards between
+    the ends, with wilds in the gaps and up to the minimum length.
+    Returns: list((tuple(int), int)) the values above first_value each run
+        uses, and the wilds it needs
+    """
+    choices = [((), MIN_RUN_LENGTH - 1)] if wild_count >= MIN_RUN_LENGTH - 1 else []
+    for end, last_value in enumerate(values):
+        span = last_value - first_value + 1
+        for inner_count in range(end, -1, -1):
+            wilds = max(span, MIN_RUN_LENGTH) - inner_count - 2
+            if wilds > wild_count:
+                break
+            for inner_values in combinations(values[:end], inner_count):
+                choices.append((inner_values + (last_value,), wilds))
+    return choices
+
+def can_go_out(hand, round):
+    """
+    Whether find_go_out_play finds a line for the hand on an empty table,
+    searched on card codes alone.
+
+    The solver's lines there are runs, then sets that each take every card
+    of their value and all the wilds left. So cards are taken in value
+    order, each either starting a run or kept for the sets, and once a
+    value is passed the cards kept of it are final: more than one of them
+    that no set takes rules the branch out.
+    Args:
+        hand(iterable(int)): card codes
+        round(int): round number, which sets the wild value
+    Returns: bool
+    """
+    wild_mask = wild_value_mask(round)
+    non_wilds = sorted((code for code in hand if not wild_mask >> (code & VALUE_MASK) & 1), key = lambda code: (code & VALUE_MASK, code))
+    wild_count = len(hand) - len(non_wilds)
+    searched = {}
+
+    def search(cards, kept_counts, wilds):
+        next_value = cards[0] & VALUE_MASK if cards else WILD_VALUE
+        # The wilds can make one more set out of the kept cards of one value.
+        left_over, wild_set_size = 0, 0
+        for count in kept_counts[1:next_value]:
+            if count < MIN_SET_LENGTH:
+                left_over += count
+                if wilds and count + wilds >= MIN_SET_LENGTH:
+                    wild_set_size = max(wild_set_size, count)
+        if left_over - wild_set_size > 1:
+            return False
+        if not cards:
+            return True
+        key = (cards, kept_counts, wilds)
+        if key not in searched:
+            code, rest = cards[0], cards[1:]
+            suit, value = code >> SUIT_SHIFT, code & VALUE_MASK
+            counts = list(kept_counts)
+            counts[value] += 1
+            result = search(rest, tuple(counts), wilds)
+            if not result:
+                values = sorted({other & VALUE_MASK for other in rest if other >> SUIT_SHIFT == suit and other & VALUE_MASK > value})
+                for run_values, run_wilds in _get_run_choices(value, values, wilds):
+                    remaining = list(rest)
+                    for run_value in run_values:
+                        remaining.remove(suit << SUIT_SHIFT | run_value)
+                    if search(tuple(remaining), kept_counts, wilds - run_wilds):
+                        result = True
+                        break
+            searched[key] = result
+        return searched[key]
+
+    return search(tuple(non_wilds), (0,) * WILD_VALUE, wild_count)
+
+class BatchRoundSimulator:
+    """
+    Plays many rounds at once with every player drawing from the deck and
+    discarding its highest scoring card, as Player does, with hands kept as
+    arrays of card codes in the order Player's hand holds them.
+
+    Hands that can't go out are ruled out in bulk with might_go_out; the few
+    that might are checked with can_go_out, which agrees with Player.
+    """
+    round = None
+    player_count = None
+    deck_count = None
+    random = None
+    _go_out_cache = None
+
+    def __init__(self, round, player_count = 2, deck_count = 2, seed = None):
+        if round < 3 or round > 13:
+            raise Exception("Round must be between 3 and 13")
+        if player_count < 2:
+            raise Exception("Must have at least 2 players")
+        self.round = round
+        self.player_count = player_count
+        self.deck_count = deck_count
+        self.random = np.random.default_rng(seed)
+        self._go_out_cache = {}
+
+    def deal(self, count):
+        """
+        Returns: np.ndarray shuffled decks, one per row, in the order cards
+            are dealt and drawn
+        """
+        decks = np.tile(np.tile(DECK_CODES, self.deck_count), (count, 1))
+        return self.random.permuted(decks, axis=1)
+
+    def _can_go_out(self, hand):
+        """
+        Whether Player would go out holding these cards. Which wild sits where
+        doesn't change how many cards the best line leaves, so hands are cached
+        by their sorted codes.
+        """
+        key = tuple(sorted(hand.tolist()))
+        if key not in self._go_out_cache:
+            self._go_out_cache[key] = can_go_out(key, self.round)
+        return self._go_out_cache[key]
+
+    def simulate(self, decks):
+        """
+        Play each deck until a player goes out.
+        Args:
+            decks(np.ndarray): decks from deal(), or card codes in draw order
+        Returns: dict(string, np.ndarray) per round: "first_out_turn" and
+            "first_out_player" (-1 if the deck ran out first), "hands" as they
+            stood then, and "next_draw", the position of the next card to draw
+        """
+        count, deck_size = decks.shape
+        round, players = self.round, self.player_count
+        _, scores = get_code_tables(round)
+
+        # Card k of the deal goes to player k % players, as Round deals.
+        hands = np.full((count, players, round + 1), -1, dtype=np.int16)
+        hands[:, :, :round] = decks[:, :round * players].reshape(count, round, players).transpose(0, 2, 1)
+        next_draw = round * players + 1
+        first_out_turn = np.full(count, -1)
+        first_out_player = np.full(count, -1)
+        active = np.arange(count)
+
+        turn = 0
+        while len(active) and next_draw < deck_size:
+            player = (turn + round) % players
+            hand = hands[active, player]
+            hand[:, round] = decks[active, next_draw]
+
+            candidates = np.flatnonzero(might_go_out(hand, round))
+            going_out = np.array([self._can_go_out(hand[row]) for row in candidates], dtype=bool)
+            out_rows = candidates[going_out] if len(candidates) else candidates
+            first_out_turn[active[out_rows]] = turn
+            first_out_player[active[out_rows]] = player
+
+            # Discard the last of the highest scoring cards, as sorting by score
+            # and taking the end does, then remove the first card with its code.
+            card_scores = scores[hand]
+            last_highest = round - np.argmax(card_scores[:, ::-1], axis=1)
+            discard = hand[np.arange(len(hand)), last_highest]
+            first_match = np.argmax(hand == discard[:, None], axis=1)
+            positions = np.arange(round)[None, :]
+            hand[:, :round] = np.take_along_axis(hand, positions + (positions >= first_match[:, None]), axis=1)
+            hand[:, round] = -1
+
+            staying = np.ones(len(active), dtype=bool)
+            staying[out_rows] = False
+            # Hands that went out keep the card they drew.
+            hand[out_rows] = hands[active[out_rows], player]
+            hand[out_rows, round] = decks[active[out_rows], next_draw]
+            hands[active, player] = hand
+            active = active[staying]
+            next_draw += 1
+            turn += 1
+
+        return {
+            "first_out_turn": first_out_turn,
+            "first_out_player": first_out_player,
+            "hands": hands,
+            "next_draw": np.where(first_out_turn >= 0, round * players + 1 + first_out_turn + 1, deck_size),
+        }
+
+def get_round_statistics(round, deal_count, player_count = 2, seed = None, batch_size = 10000):
+    """
+    Returns: dict(string, float) how often and how soon someone goes out
+    """
+    simulator = BatchRoundSimulator(round, player_count, seed = seed)
+    turns = []
+    for start in range(0, deal_count, batch_size):
+        results = simulator.simulate(simulator.deal(min(batch_size, deal_count - start)))
+        turns.append(results["first_out_turn"])
+    turns = np.concatenate(turns)
+    went_out = turns >= 0
+    return {
+        "round": round,
+        "deals": deal_count,
+        "go_out_rate": float(went_out.mean()),
+        "mean_turns_to_go_out": float(turns[went_out].mean()) if went_out.any() else None,
+        "go_out_first_turn_rate": float((turns == 0).mean()),
+    }
+
+def run_script(args):
+    for round in args.rounds or range(3, 14):
+        start = time.time()
+        statistics = get_round_statistics(round, args.deals, args.players, args.seed)
+        elapsed = time.time() - start
+        logging.warning("{} ({:.0f} deals/s)".format(statistics, args.deals / elapsed))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Simulate many rounds at once')
+    parser.add_argument('--deals', type=int, default=100000, help='Rounds to simulate per round number')
+    parser.add_argument('--players', type=int, default=2, help='Players per round')
+    parser.add_argument('--rounds', type=int, nargs='*', help='Round numbers to simulate, all if omitted')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for the deals')
+
+    logging.basicConfig(level=logging.WARNING)
+
+    args = parser.parse_args()
+    run_script(args)
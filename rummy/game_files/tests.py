@@ -1,5 +1,19 @@
+import copy
+import io
+import json
+import pickle
+import os
+import tempfile
 import time
+from types import SimpleNamespace
 from datastructures import *
+from events import *
+from game import *
+from replay import *
+from simulator import *
+from run_tournament import *
+# Imported whole, since its run_script would shadow the tournament's.
+import benchmark
 
 def test_get_sets():
     # Test 1 group of duplicates.
@@ -342,6 +356,46 @@ def test_get_all_plays():
     assert best_play[0].get_score(3) == 0
     assert best_play[1] == expected_play
 
+def test_get_all_plays_skips_reordered_lines():
+    run = [Card(Suits.CLUB, 6), Card(Suits.CLUB, 7), Card(Suits.CLUB, 8)]
+    set = [Card(Suits.SPADE, 9), Card(Suits.HEART, 9), Card(Suits.DIAMOND, 9)]
+    hand = Hand(run + set)
+    lines = [line for _, line in get_all_plays(hand, 3, [])]
+    # The run and the set share no cards, so they're only played in one order.
+    assert len(lines) == 4
+    assert [RunPlay(run, 3), SetPlay(set, 3)] in lines
+    assert [SetPlay(set, 3), RunPlay(run, 3)] not in lines
+
+    # Which wild fills a spot doesn't change the play.
+    round = 5
+    assert get_play_signature(RunPlay([Card(Suits.CLUB, 6), Card(Suits.JOKER, 14), Card(Suits.CLUB, 8)], round), round) == \
+        get_play_signature(RunPlay([Card(Suits.CLUB, 6), Card(Suits.HEART, 5), Card(Suits.CLUB, 8)], round), round)
+
+def test_get_all_plays_leaves_inputs_untouched():
+    hand = BitboardHand()
+    hand.add(Card(Suits.CLUB, 3))
+    hand.add(Card(Suits.CLUB, 4))
+    hand.add(Card(Suits.JOKER, 14))
+    hand.add(Card(Suits.CLUB, 8))
+    hand.add(Card(Suits.HEART, 8))
+    hand.add(Card(Suits.CLUB, 9))
+    round = 5
+    public_groups = [
+        RunPlay([Card(Suits.CLUB, 5), Card(Suits.CLUB, 6), Card(Suits.CLUB, 7)], round),
+        SetPlay([Card(Suits.SPADE, 8), Card(Suits.DIAMOND, 8), Card(Suits.DIAMOND, 8)], round),
+    ]
+    hand_cards = list(hand.cards)
+    group_cards = [list(group.cards) for group in public_groups]
+
+    plays = list(get_all_plays(hand, round, public_groups))
+
+    assert hand.cards == hand_cards
+    assert [group.cards for group in public_groups] == group_cards
+    # Yielded lines are independent of each other.
+    assert len(set(id(play[1]) for play in plays)) == len(plays)
+    best_play = sorted(plays, key = lambda x: x[0].get_score(round))[0]
+    assert best_play[0].get_score(round) == 0
+
 def test_optimal_plays():
     def get_best_play(hand, round, groups):
         best_play = sorted(list(get_all_plays(hand, round, groups)), key = lambda x: x[0].get_score(round))[0]
@@ -547,26 +601,27 @@ def test_optimal_plays():
     score, discard, groups = get_best_play(hand, round, public_groups)
     logging.debug("Test Result: {}, {}, {}".format(score, discard, groups))
     assert score == 2
-    assert discard == Card(Suits.SPADE, 9)
+    # Runs are grouped per suit, so ♢7 no longer hides the ♠7 ♠8 ♠9 run.
+    assert discard == Card(Suits.DIAMOND, 7)
     assert groups == [RunPlay([
-            Card(Suits.DIAMOND, 11), 
-            Card(Suits.DIAMOND, 12), 
-            FixedCard(Card(Suits.DIAMOND, 13), Card(Suits.JOKER, 14), round), 
-        ], round),
-        RunPlay([
             Card(Suits.CLUB, 10), 
             Card(Suits.CLUB, 11), 
             Card(Suits.CLUB, 12), 
         ], round),
         RunPlay([
-            Card(Suits.HEART, 10), 
-            Card(Suits.HEART, 11), 
-            Card(Suits.HEART, 12), 
+            Card(Suits.SPADE, 7), 
+            Card(Suits.SPADE, 8), 
+            Card(Suits.SPADE, 9), 
+        ], round),
+        RunPlay([
+            Card(Suits.DIAMOND, 11), 
+            Card(Suits.DIAMOND, 12), 
+            Card(Suits.DIAMOND, 13), 
         ], round),
         SetPlay([
-            Card(Suits.SPADE, 7), 
-            Card(Suits.DIAMOND, 7), 
-            Card(Suits.CLUB, 7), 
+            Card(Suits.CLUB, 12), 
+            Card(Suits.HEART, 12), 
+            Card(Suits.CLUB, 12), 
         ], round)]
 
     # Discarding 4 seems like a bad choice, 2 seems better..
@@ -594,16 +649,16 @@ def test_optimal_plays():
     score, discard, groups = get_best_play(hand, round, public_groups)
     logging.debug("Test Result: {}, {}, {}".format(score, discard, groups))
     assert score == 2
-    assert discard == Card(Suits.CLUB, 4)
+    assert discard == Card(Suits.DIAMOND, 3)
     assert groups == [RunPlay([
-            Card(Suits.DIAMOND, 3), 
-            Card(Suits.DIAMOND, 4), 
-            Card(Suits.DIAMOND, 5), 
+            Card(Suits.CLUB, 3), 
+            Card(Suits.CLUB, 4), 
+            Card(Suits.CLUB, 5), 
         ], round),
         RunPlay([
-            Card(Suits.CLUB, 3), 
             Card(Suits.CLUB, 4), 
             Card(Suits.CLUB, 5), 
+            Card(Suits.CLUB, 6), 
         ], round),
         RunPlay([
             Card(Suits.DIAMOND, 9), 
@@ -656,6 +711,632 @@ def test_optimal_plays():
             Card(Suits.DIAMOND, 1),
         ], round)]
     
+def test_card_encoding():
+    for suit in Suits:
+        for value in range(1, 15):
+            card = Card(suit, value)
+            assert decode_card(encode_card(suit, value)) == card
+            assert card.code == suit.value * 16 + value
+
+    assert Card(Suits.HEART, 3) < Card(Suits.CLUB, 4)
+    assert Card(Suits.CLUB, 4) < Card(Suits.HEART, 4)
+    assert Card(Suits.JOKER, 14).is_wild(3)
+    assert Card(Suits.HEART, 5).is_wild(5)
+    assert not Card(Suits.HEART, 5).is_wild(3)
+    assert FixedCard(Card(Suits.CLUB, 6), Card(Suits.JOKER, 14), 3) == Card(Suits.CLUB, 6)
+
+def test_bitboard_hand():
+    cards = [
+        Card(Suits.DIAMOND, 1),
+        Card(Suits.SPADE, 1),
+        Card(Suits.DIAMOND, 1),
+        Card(Suits.HEART, 2),
+        Card(Suits.DIAMOND, 2),
+        Card(Suits.CLUB, 9),
+        Card(Suits.DIAMOND, 10),
+        Card(Suits.HEART, 10),
+        Card(Suits.CLUB, 11),
+        Card(Suits.JOKER, 14),
+        Card(Suits.SPADE, 7),
+    ]
+    round = 10
+    hand = Hand(list(cards))
+    bitboard_hand = BitboardHand(list(cards))
+
+    assert bitboard_hand.get_non_wilds(round) == hand.get_non_wilds(round)
+    assert bitboard_hand.get_wilds(round) == hand.get_wilds(round)
+    assert bitboard_hand.get_unique_non_wilds(round) == hand.get_unique_non_wilds(round)
+
+    public_groups = [
+        RunPlay([Card(Suits.SPADE, 1), Card(Suits.SPADE, 2), Card(Suits.SPADE, 3)], round),
+        SetPlay([Card(Suits.CLUB, 7), Card(Suits.CLUB, 7), Card(Suits.DIAMOND, 7)], round),
+    ]
+    plays = list(get_all_plays(hand, round, public_groups))
+    bitboard_plays = list(get_all_plays(bitboard_hand, round, public_groups))
+    assert len(plays) == len(bitboard_plays)
+    for play, bitboard_play in zip(plays, bitboard_plays):
+        assert play[0].cards == bitboard_play[0].cards
+        assert play[1] == bitboard_play[1]
+
+    bitboard_hand.remove(Card(Suits.DIAMOND, 1))
+    assert bitboard_hand.counts[encode_card(Suits.DIAMOND, 1)] == 1
+    bitboard_hand.remove(Card(Suits.DIAMOND, 1))
+    assert not bitboard_hand.suit_masks[Suits.DIAMOND.value] & 1 << 1
+    assert not bitboard_hand.remove(Card(Suits.DIAMOND, 1))
+    
+def test_transposition_table():
+    table = TranspositionTable(2)
+    assert table.get("a") is None
+    table.put("a", 1)
+    table.put("b", 2)
+    assert table.get("a") == 1
+    # "b" is now the least recently used.
+    table.put("c", 3)
+    assert table.get("b") is None
+    assert table.get("c") == 3
+    assert len(table) == 2
+    assert table.hits == 2
+    assert table.misses == 2
+
+def test_find_best_play():
+    hand = Hand()
+    hand.add(Card(Suits.HEART, 1))
+    hand.add(Card(Suits.HEART, 2))
+    hand.add(Card(Suits.HEART, 3))
+    hand.add(Card(Suits.CLUB, 7))
+    hand.add(Card(Suits.SPADE, 7))
+    hand.add(Card(Suits.DIAMOND, 7))
+    hand.add(Card(Suits.HEART, 9))
+    round = 6
+    public_groups = []
+
+    table = TranspositionTable()
+    remaining, line = find_best_play(hand, round, public_groups, table)
+    assert remaining.get_score(round) == 9
+    assert line == [
+        RunPlay([Card(Suits.HEART, 1), Card(Suits.HEART, 2), Card(Suits.HEART, 3)], round),
+        SetPlay([Card(Suits.CLUB, 7), Card(Suits.SPADE, 7), Card(Suits.DIAMOND, 7)], round)]
+    # Solving the same hand again is answered from the table.
+    misses = table.misses
+    assert find_best_play(hand, round, public_groups, table)[1] == line
+    assert table.hits > 0
+    assert table.misses == misses
+
+    hand = Hand()
+    hand.add(Card(Suits.HEART, 1))
+    hand.add(Card(Suits.SPADE, 2))
+    hand.add(Card(Suits.HEART, 4))
+    hand.add(Card(Suits.DIAMOND, 6))
+    hand.add(Card(Suits.DIAMOND, 9))
+    hand.add(Card(Suits.CLUB, 10))
+    hand.add(Card(Suits.HEART, 10))
+    hand.add(Card(Suits.CLUB, 12))
+    hand.add(Card(Suits.SPADE, 12))
+    hand.add(Card(Suits.DIAMOND, 12))
+    hand.add(Card(Suits.CLUB, 9))
+    round = 10
+    public_groups = [
+        RunPlay([Card(Suits.CLUB, 5), FixedCard(Card(Suits.CLUB, 6), Card(Suits.CLUB, 10), 10), Card(Suits.CLUB, 7)], round),
+        RunPlay([Card(Suits.DIAMOND, 1), Card(Suits.DIAMOND, 2), Card(Suits.DIAMOND, 3), Card(Suits.DIAMOND, 4)], round),
+        SetPlay([Card(Suits.CLUB, 13), Card(Suits.CLUB, 13), Card(Suits.DIAMOND, 13)], round),
+    ]
+    expected_play = sorted(get_all_plays(hand, round, public_groups), key = lambda x: x[0].get_score(round))[0]
+    best_play = find_best_play(hand, round, public_groups)
+    assert best_play[0].cards == expected_play[0].cards
+    assert best_play[1] == expected_play[1]
+
+def test_determine_play_goes_out():
+    round = SimpleNamespace(round_number = 7, public_groups = [])
+    cards = [Card(Suits.HEART, 3), Card(Suits.SPADE, 11), Card(Suits.SPADE, 1), Card(Suits.SPADE, 1),
+        Card(Suits.DIAMOND, 7), Card(Suits.CLUB, 7), Card(Suits.SPADE, 11), Card(Suits.CLUB, 11)]
+    # The lowest scoring line leaves both aces, two cards, so it can't go out...
+    assert find_best_play(Hand(list(cards)), 7, [])[0].cards == [Card(Suits.SPADE, 1), Card(Suits.SPADE, 1)]
+    # ...but playing the aces with the wilds leaves only the 3.
+    remaining, line = find_go_out_play(Hand(list(cards)), 7, [])
+    assert remaining.cards == [Card(Suits.HEART, 3)]
+    player = Player("Abe")
+    for card in cards:
+        player.draw_card(card)
+    assert player.determine_play(player.hand, round)[0].cards == [Card(Suits.HEART, 3)]
+
+    # Two kings can't join anything, so there's no way out.
+    cards = [Card(Suits.CLUB, 4), Card(Suits.CLUB, 5), Card(Suits.CLUB, 6), Card(Suits.SPADE, 13), Card(Suits.HEART, 13)]
+    assert find_go_out_play(Hand(cards), 3, []) is None
+
+    # Once someone is out, the 7 and 9 left after the set keep 7 points past
+    # the discard, where the lowest scoring line's 4, 4 and 7 keep 8.
+    round = SimpleNamespace(round_number = 5, public_groups = [
+        SetPlay([Card(Suits.CLUB, 13), Card(Suits.DIAMOND, 13), Card(Suits.HEART, 13)], 5)])
+    cards = [Card(Suits.SPADE, 4), Card(Suits.CLUB, 5), Card(Suits.CLUB, 5), Card(Suits.DIAMOND, 4), Card(Suits.HEART, 7), Card(Suits.CLUB, 9)]
+    assert find_best_play(Hand(list(cards)), 5, round.public_groups)[0].get_score(5) == 15
+    player = Player("Abe")
+    for card in cards:
+        player.draw_card(card)
+    remaining, line = player.determine_play(player.hand, round)
+    assert sorted(remaining.cards) == sorted([Card(Suits.HEART, 7), Card(Suits.CLUB, 9)])
+
+def test_get_score_lower_bound():
+    hand = Hand()
+    hand.add(Card(Suits.HEART, 1))
+    hand.add(Card(Suits.HEART, 2))
+    hand.add(Card(Suits.HEART, 3))
+    hand.add(Card(Suits.CLUB, 9))
+    hand.add(Card(Suits.SPADE, 12))
+    hand.add(Card(Suits.DIAMOND, 5))
+    round = 7
+    public_groups = [
+        RunPlay([Card(Suits.CLUB, 5), Card(Suits.CLUB, 6), Card(Suits.CLUB, 7)], round),
+        SetPlay([Card(Suits.HEART, 5), Card(Suits.SPADE, 5), Card(Suits.CLUB, 5)], round),
+    ]
+    # Only the Q can't be played; the 9 is too far from the run without a wild.
+    assert get_score_lower_bound(hand, round, public_groups) == 19
+    assert find_best_play(hand, round, public_groups)[0].get_score(round) == 19
+
+    hand.add(Card(Suits.JOKER, 14))
+    # A wild can now fill the 8 between the run and the 9.
+    assert get_score_lower_bound(hand, round, public_groups) == 10
+    hand.add(Card(Suits.HEART, 7))
+    # Two wilds can make a set with anything.
+    assert get_score_lower_bound(hand, round, public_groups) == 0
+
+def test_extension_tables():
+    round = 5
+    lower_extension, upper_extension = get_run_extensions([Card(Suits.JOKER, 14), Card(Suits.CLUB, 3), Card(Suits.HEART, 5)], round)
+    assert lower_extension.first_value == 1 and lower_extension.suit == Suits.CLUB
+    assert upper_extension.first_value == 5 and upper_extension.suit == Suits.CLUB
+    # A wild in front of an ace would have to represent a 0.
+    assert get_run_extensions([Card(Suits.JOKER, 14), Card(Suits.CLUB, 1), Card(Suits.CLUB, 2)], round) is None
+    assert get_run_extensions([Card(Suits.CLUB, 12), Card(Suits.CLUB, 13), Card(Suits.JOKER, 14)], round) is None
+    assert get_run_extensions([Card(Suits.JOKER, 14)] * 13, round) == (None, None)
+
+    assert get_set_extensions([Card(Suits.CLUB, 7), Card(Suits.JOKER, 14), Card(Suits.HEART, 7)], round).first_value == 7
+    assert get_set_extensions([Card(Suits.CLUB, 7), Card(Suits.JOKER, 14), Card(Suits.HEART, 8)], round) is None
+    assert get_set_extensions([Card(Suits.JOKER, 14), Card(Suits.HEART, 5)], round).last_value == 13
+
+    group = RunPlay([Card(Suits.CLUB, 5), Card(Suits.CLUB, 6), Card(Suits.CLUB, 7)], round)
+    play = PublicGroupPlay([Card(Suits.CLUB, 8)], round, group, True)
+    assert play.can_add_card(Card(Suits.CLUB, 9), True)
+    assert play.can_add_card(Card(Suits.JOKER, 14), True)
+    assert not play.can_add_card(Card(Suits.HEART, 9), True)
+    assert not play.can_add_card(Card(Suits.CLUB, 9), False)
+
+def test_meld_index():
+    round = 5
+    hand = BitboardHand([Card(Suits.HEART, 9), Card(Suits.CLUB, 7), Card(Suits.HEART, 7), Card(Suits.CLUB, 7),
+        Card(Suits.JOKER, 14), Card(Suits.HEART, 5), Card(Suits.HEART, 12)])
+    index = MeldIndex(hand, round)
+    assert index.wilds == [Card(Suits.HEART, 5), Card(Suits.JOKER, 14)]
+    assert index.unique_non_wilds == [Card(Suits.CLUB, 7), Card(Suits.HEART, 7), Card(Suits.HEART, 9), Card(Suits.HEART, 12)]
+    assert index.cards_by_value[7] == [Card(Suits.CLUB, 7), Card(Suits.CLUB, 7), Card(Suits.HEART, 7)]
+    assert index.value_counts[7] == 3
+    assert index.suit_values[Suits.HEART.value] == [7, 9, 12]
+    assert index.get_suited_above(Suits.HEART.value, 7) == [Card(Suits.HEART, 9), Card(Suits.HEART, 12)]
+    assert index.get_suited_below(Suits.HEART.value, 12) == [Card(Suits.HEART, 7), Card(Suits.HEART, 9)]
+
+    # The generators give the same melds from a shared index as from the hand.
+    group = RunPlay([Card(Suits.HEART, 1), Card(Suits.HEART, 2), Card(Suits.HEART, 3)], round)
+    assert list(get_non_redundant_runs(hand, round, index)) == list(get_non_redundant_runs(Hand(list(hand.cards)), round))
+    assert list(get_sets(hand, round, True, index)) == list(get_sets(Hand(list(hand.cards)), round, True))
+    assert get_non_redundant_run_group_extensions(hand, round, group, index) == \
+        get_non_redundant_run_group_extensions(Hand(list(hand.cards)), round, group)
+
+def test_public_table():
+    round = 3
+    run = RunPlay([Card(Suits.HEART, 5), Card(Suits.HEART, 6), Card(Suits.HEART, 7)], round)
+    first_set = SetPlay([Card(Suits.CLUB, 9), Card(Suits.SPADE, 9), Card(Suits.HEART, 9)], round)
+    second_set = SetPlay([Card(Suits.CLUB, 9), Card(Suits.SPADE, 9), Card(Suits.HEART, 9)], round)
+    table = PublicTable([first_set, run, second_set])
+    assert table == [first_set, run, second_set]
+    assert table.sets == [first_set, second_set] and table.runs == [run]
+    assert table.position(second_set) == 2
+    # Equal groups are found in the order they were played.
+    assert table.find(second_set.copy()) is first_set
+    assert table.get_set(9) is first_set and table.get_set(5) is None
+    assert table.get_set_values() == {9}
+    assert table.get_runs_taking(Card(Suits.HEART, 8), True) == [run]
+    assert table.get_runs_taking(Card(Suits.HEART, 4), False) == [run]
+    assert table.get_runs_taking(Card(Suits.CLUB, 8), True) == []
+
+    # Growing a group through a play keeps the table's index up to date.
+    hand = Hand([Card(Suits.HEART, 8)])
+    play = PublicGroupPlay([Card(Suits.HEART, 8)], round, run.copy(), True)
+    assert play.execute_on(hand, table) is run
+    assert hand.cards == []
+    assert table.get_runs_taking(Card(Suits.HEART, 8), True) == []
+    assert table.get_runs_taking(Card(Suits.HEART, 9), True) == [run]
+    assert table.find(RunPlay([Card(Suits.HEART, 5), Card(Suits.HEART, 6), Card(Suits.HEART, 7), Card(Suits.HEART, 8)], round)) is run
+
+    # Fixing an all-wild set's wilds keys it by its new value.
+    wild_set = SetPlay([Card(Suits.CLUB, 3), Card(Suits.SPADE, 3), Card(Suits.HEART, 3)], round)
+    table.append(wild_set)
+    assert table.get_set_values() == {1, 9}
+    hand = Hand([Card(Suits.HEART, 10)])
+    PublicGroupPlay([Card(Suits.HEART, 10)], round, wild_set.copy(), True).execute_on(hand, table)
+    assert table.get_set_values() == {9, 10}
+    assert table.get_set(10) is wild_set and table.get_set(1) is None
+
+    # Copies index their own groups, and only append and extend add to the table.
+    for copied in [copy.deepcopy(table), pickle.loads(pickle.dumps(table))]:
+        assert copied == table and copied.groups[0] is not first_set
+        assert copied.sets == [copied[0], copied[2], copied[3]] and copied.runs == [copied[1]]
+        assert copied.find(first_set) is copied[0] and copied.get_set(10) is copied[3]
+        assert copied.get_runs_taking(Card(Suits.HEART, 9), True) == [copied[1]]
+        assert copied.position(copied[3]) == 3
+    for method in ["insert", "remove", "pop", "__iadd__", "__setitem__"]:
+        assert not hasattr(table, method)
+
+def test_seeded_deck():
+    deck = Deck(2, 7)
+    deck.shuffle()
+    same_seed = Deck(2, 7)
+    same_seed.shuffle()
+    assert deck.cards == same_seed.cards
+
+    # A shared generator keeps advancing, so the next deck gets a new order.
+    shared = random.Random(7)
+    first = Deck(2, shared)
+    first.shuffle()
+    second = Deck(2, shared)
+    second.shuffle()
+    assert first.cards == deck.cards
+    assert second.cards != first.cards
+
+def test_event_log():
+    assert not EventLog.silent().enabled
+
+    record = io.StringIO()
+    events = EventLog([JsonlSink(record)])
+    wild = Card(Suits.JOKER, 14)
+    fixed = FixedCard(Card(Suits.HEART, 5), wild, 3)
+    events.emit("deal", player = "Abe", hand = Hand([Card(Suits.CLUB, 1), wild]))
+    events.emit("discard", card = fixed)
+    lines = [json.loads(line) for line in record.getvalue().splitlines()]
+    assert lines[0] == {"event": "deal", "player": "Abe", "hand": [Card(Suits.CLUB, 1).code, wild.code]}
+    assert lines[1] == {"event": "discard", "card": {"wild": wild.code, "as": Card(Suits.HEART, 5).code}}
+
+def test_replay():
+    record = io.StringIO()
+    replay = io.BytesIO()
+    game = Game([Player("Abe"), Player("Brenna")], 2, 11, EventLog([JsonlSink(record), ReplaySink(replay)]))
+    game.play()
+    game.play()
+
+    reader = ReplayReader(replay.getvalue())
+    games = reader.index()
+    assert [(x["players"], x["seed"]) for x in games] == [(["Abe", "Brenna"], 11)] * 2
+    assert games[1]["scores"] == [player.score for player in game.player_list]
+
+    # The replay holds the same events as the full record, less the fields
+    # that can be rebuilt from it.
+    records = [json.loads(line) for line in record.getvalue().splitlines()]
+    records = [x for x in records if x["event"] in EVENT_CODES]
+    replayed = list(reader.events())
+    assert len(replayed) == len(records)
+    for (event, fields), full in zip(replayed, records):
+        assert event == full["event"]
+        assert fields == {name: full[name] for name, _ in EVENT_FIELDS[event]}
+    second_game = [event for event, _ in replayed].index("game_start", 1)
+    assert reader.read_game(games[0]["offset"]) == replayed[:second_game]
+    assert reader.read_game(games[1]["offset"]) == replayed[second_game:]
+
+    # Cut after the first game's start, only the second game is indexed.
+    data = replay.getvalue()
+    _, length = EVENT_HEADER.unpack_from(data, games[0]["offset"])
+    cut = ReplayReader(REPLAY_HEADER + data[games[0]["offset"] + EVENT_HEADER.size + length:])
+    assert [x["scores"] for x in cut.index()] == [games[1]["scores"]]
+
+def test_incremental_best_play():
+    round = SimpleNamespace(round_number = 3, public_groups = [])
+    player = Player("Abe")
+    for card in [Card(Suits.CLUB, 4), Card(Suits.CLUB, 5), Card(Suits.CLUB, 6), Card(Suits.HEART, 9)]:
+        player.draw_card(card)
+    best_play = player.determine_play(player.hand, round)
+    assert best_play[0].get_score(3) == 9
+
+    # The king can't join anything, so the best line just leaves it over too.
+    player.draw_card(Card(Suits.SPADE, 13), round)
+    assert player.determine_play(player.hand, round) is best_play
+    assert best_play[0].get_score(3) == 19
+    player.hand.remove(Card(Suits.SPADE, 13))
+    player.discarded(Card(Suits.SPADE, 13))
+    assert player.determine_play(player.hand, round) is best_play
+    assert best_play[0].get_score(3) == 9
+
+    # The 7 extends the run, so the hand has to be solved again.
+    player.draw_card(Card(Suits.CLUB, 7), round)
+    assert player.best_play is None
+    assert player.determine_play(player.hand, round)[0].get_score(3) == 9
+
+    # Throwing away the ♠Q that sat between ♣J and ♣Q leaves the same line as a fresh search.
+    round = SimpleNamespace(round_number = 4, public_groups = [])
+    player = Player("Abe")
+    for card in [Card(Suits.CLUB, 11), Card(Suits.CLUB, 12), Card(Suits.SPADE, 12), Card(Suits.CLUB, 13)]:
+        player.draw_card(card)
+    player.determine_play(player.hand, round)
+    player.draw_card(Card(Suits.HEART, 9), round)
+    player.determine_play(player.hand, round)
+    player.hand.remove(Card(Suits.SPADE, 12))
+    player.discarded(Card(Suits.SPADE, 12))
+    assert player.best_play[0].cards == find_best_play(Hand(list(player.hand.cards)), 4, [])[0].cards
+    assert player.best_play[0].cards == [Card(Suits.HEART, 9)]
+
+def test_find_best_play_with_draw():
+    cards = Hand([Card(Suits.CLUB, 4), Card(Suits.CLUB, 5), Card(Suits.CLUB, 6), Card(Suits.HEART, 9)])
+    with_card, without_card = find_best_play_with_draw(cards, Card(Suits.SPADE, 13), 3, [])
+    assert with_card[0].get_score(3) == 19
+    assert without_card[0].get_score(3) == 9
+    assert with_card[1] == without_card[1]
+    # The 7 joins the run, so the hand on its own needs another search.
+    with_card, without_card = find_best_play_with_draw(cards, Card(Suits.CLUB, 7), 3, [])
+    assert with_card[0].get_score(3) == 9
+    assert without_card is None
+
+    # Every unseen card drawn onto a set and a king, weighted by how many are left.
+    cards = Hand([Card(Suits.CLUB, 8), Card(Suits.HEART, 8), Card(Suits.SPADE, 8), Card(Suits.HEART, 13)])
+    unseen_counts = get_unseen_card_counts(cards.cards + [FixedCard(Card(Suits.CLUB, 7), Card(Suits.JOKER, 14), 3)])
+    assert sum(unseen_counts) == 108 - 5
+    assert unseen_counts[Card(Suits.JOKER, 14).code] == 3
+    expected_score = 0
+    for code, count in enumerate(unseen_counts):
+        if count:
+            drawn = Hand(cards.cards + [CARDS_BY_CODE[code]])
+            expected_score += count * find_best_play(drawn, 3, [])[0].get_score(3)
+    assert abs(get_expected_draw_score(cards, 3, [], unseen_counts) - expected_score / sum(unseen_counts)) < 1e-9
+
+    # Drawing the ♣Q makes a run around the ♠Q.
+    cards = Hand([Card(Suits.CLUB, 11), Card(Suits.SPADE, 12), Card(Suits.CLUB, 13), Card(Suits.HEART, 9)])
+    unseen_counts = get_unseen_card_counts(cards.cards)
+    expected_score = 0
+    for code, count in enumerate(unseen_counts):
+        if count:
+            drawn = Hand(cards.cards + [CARDS_BY_CODE[code]])
+            expected_score += count * find_best_play(drawn, 4, [])[0].get_score(4)
+    assert abs(get_expected_draw_score(cards, 4, [], unseen_counts) - expected_score / sum(unseen_counts)) < 1e-9
+
+def test_choose_discard():
+    cards = Hand([Card(Suits.CLUB, 11), Card(Suits.CLUB, 12), Card(Suits.CLUB, 13), Card(Suits.HEART, 5), Card(Suits.HEART, 9)])
+    assert choose_discard(cards, 3, []) == Card(Suits.HEART, 9)
+
+    # With nothing left over, only an end of the run can go without breaking it.
+    cards = Hand([Card(Suits.CLUB, 10), Card(Suits.CLUB, 11), Card(Suits.CLUB, 12), Card(Suits.CLUB, 13)])
+    assert choose_discard(cards, 3, []) in [Card(Suits.CLUB, 10), Card(Suits.CLUB, 13)]
+    assert choose_discard(Hand(), 3, []) is None
+
+    # The ♠Q sits between ♣J and ♣Q, but the run is still found, so it goes.
+    cards = Hand([Card(Suits.CLUB, 11), Card(Suits.CLUB, 12), Card(Suits.SPADE, 12), Card(Suits.CLUB, 13), Card(Suits.HEART, 9)])
+    assert choose_discard(cards, 4, []) == Card(Suits.SPADE, 12)
+
+def test_find_best_play_by_deadline():
+    hand = Hand([Card(Suits.HEART, 1), Card(Suits.HEART, 2), Card(Suits.HEART, 3),
+        Card(Suits.CLUB, 7), Card(Suits.SPADE, 7), Card(Suits.DIAMOND, 7), Card(Suits.HEART, 9)])
+    round = 6
+    exact = find_best_play(hand, round, [])
+
+    # Given time to finish, deepening finds the exact line.
+    remaining, line = find_best_play(hand, round, [], deadline = time.perf_counter() + 60)
+    assert remaining.cards == exact[0].cards
+    assert line == exact[1]
+
+    # Out of time, the hand is still played out.
+    remaining, line = find_best_play(hand, round, [], deadline = time.perf_counter() - 1)
+    assert line == []
+    assert remaining.get_score(round) == hand.get_score(round)
+    assert choose_discard(hand, round, [], deadline = time.perf_counter() - 1) == Card(Suits.HEART, 9)
+
+    # A search cut short leaves nothing in the table it didn't finish.
+    table = TranspositionTable()
+    solver = PlaySolver(round, table)
+    solver._get_best_line(copy.deepcopy(hand), [], float("inf"), 1)
+    assert solver.truncations > 0
+    assert table.get(get_hand_signature(hand, round, [])) is None
+    assert find_best_play(hand, round, [], table)[1] == exact[1]
+
+    deck = Deck(2, 7)
+    deck.shuffle()
+    hand = BitboardHand([deck.deal() for _ in range(14)])
+    start = time.perf_counter()
+    remaining, line = find_best_play(hand, 13, [], deadline = start + 0.02)
+    assert time.perf_counter() - start < 0.5
+    assert remaining.get_score(13) <= hand.get_score(13)
+
+class _EventListSink:
+    def __init__(self):
+        self.events = []
+
+    def record(self, event, fields):
+        self.events.append((event, dict(fields)))
+
+def test_batch_round_simulator():
+    deal_random = random.Random(3)
+    for _ in range(200):
+        round = deal_random.randint(3, 13)
+        deck = Deck(2, deal_random)
+        deck.shuffle()
+        hand = Hand([deck.deal() for _ in range(round + 1)])
+        codes = np.array([[card.code for card in hand.cards]])
+        assert count_dead_cards(codes, round)[0] == len(get_dead_cards(hand, round, []))
+        can_go_out_now = find_go_out_play(hand, round, []) is not None
+        assert can_go_out(codes[0].tolist(), round) == can_go_out_now
+        if not might_go_out(codes, round)[0]:
+            assert not can_go_out_now
+
+    # The simulator goes out on the same turn as the game engine, dealt the same deck.
+    for seed in range(12):
+        round = 3 + seed % 4
+        deck = Deck(2, seed)
+        deck.shuffle()
+        sink = _EventListSink()
+        players = [Player("Abe"), Player("Brenna")]
+        Round(players, round, 2, seed, EventLog([sink])).play_until_round_over()
+        first_out = [event for event, _ in sink.events].index("first_out")
+        last_turn = [fields for event, fields in sink.events[:first_out] if event == "turn"][-1]
+
+        results = BatchRoundSimulator(round).simulate(np.array([[card.code for card in reversed(deck.cards)]]))
+        assert results["first_out_turn"][0] == last_turn["turn"]
+        assert players[results["first_out_player"][0]].name == last_turn["player"]
+
+def test_go_out_line_shape():
+    # can_go_out searches the solver's lines on an empty table by their shape:
+    # runs of one suit, then sets that each take every card of their value and
+    # every wild left. Lines that go out must keep that shape.
+    deal_random = random.Random(5)
+    checked = 0
+    while checked < 25:
+        round = deal_random.randint(3, 9)
+        deck = Deck(2, deal_random)
+        deck.shuffle()
+        cards = [deck.deal() for _ in range(round + 1)]
+        go_out_play = find_go_out_play(Hand(list(cards)), round, [])
+        assert can_go_out([card.code for card in cards], round) == (go_out_play is not None)
+        if go_out_play is None:
+            continue
+        checked += 1
+        left = list(cards)
+        made_set = False
+        for group in go_out_play[1]:
+            played = group.cards
+            for card in played:
+                left.remove(card)
+            non_wilds = [card for card in played if not card.is_wild(round)]
+            if isinstance(group, RunPlay):
+                assert not made_set
+                assert len(set(card.suit for card in non_wilds)) <= 1
+                continue
+            made_set = True
+            assert not any(card.value == non_wilds[0].value and not card.is_wild(round) for card in left)
+            if len(non_wilds) < len(played):
+                assert not any(card.is_wild(round) for card in left)
+
+def test_read_results():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "results.jsonl")
+        header = {"event": "tournament", "seed": 5, "num_games": 1, "players": ["Abe", "Brenna"]}
+        game = {"event": "game", "game": 0, "players": ["Abe", "Brenna"], "winner": "Abe"}
+        whole_lines = json.dumps(header) + "\n" + json.dumps(game) + "\n"
+        with open(path, "w") as results_file:
+            # The run was killed halfway through the second game's line.
+            results_file.write(whole_lines + json.dumps(game)[:10])
+        assert read_results(path) == (header, [game], len(whole_lines))
+
+        with open(path, "w") as results_file:
+            results_file.write(json.dumps(game) + "\n")
+        try:
+            read_results(path)
+            assert False
+        except Exception as e:
+            assert "not a tournament results file" in str(e)
+
+def test_resume_tournament():
+    players = ["Abe", "Brenna", "CardBot"]
+    with tempfile.TemporaryDirectory() as directory:
+        args = SimpleNamespace(num_games = 0, workers = 1, seed = None, verbose = False, resume = True, bootstrap_samples = 0, move_budget_ms = None,
+            results = os.path.join(directory, "results.jsonl"), record = os.path.join(directory, "record.jsonl"), replay = os.path.join(directory, "replay.bin"))
+        def write_outputs(games):
+            with open(args.results, "w") as results_file:
+                results_file.write(json.dumps({"event": "tournament", "seed": 5, "num_games": 0, "players": players}) + "\n")
+                for game in games:
+                    results_file.write(json.dumps(game) + "\n")
+            with open(args.record, "w") as record_file:
+                record_file.write("{\"event\": \"tournament_game\"}\n{\"event\": \"tu")
+            with open(args.replay, "wb") as replay_file:
+                replay_file.write(REPLAY_HEADER + b"\x01\x02\x03")
+
+        # Killed before any game finished, so everything after the header goes.
+        write_outputs([])
+        run_script(args)
+        assert os.path.getsize(args.record) == 0
+        with open(args.replay, "rb") as replay_file:
+            assert replay_file.read() == REPLAY_HEADER
+
+        # Otherwise files go back to where the last finished game left them.
+        write_outputs([{"event": "game", "game": 0, "players": ["Abe", "Brenna"], "winner": "Abe", "record_end": 29, "replay_end": len(REPLAY_HEADER) + 2}])
+        run_script(args)
+        assert os.path.getsize(args.record) == 29
+        with open(args.replay, "rb") as replay_file:
+            assert replay_file.read() == REPLAY_HEADER + b"\x01\x02"
+
+def test_elo():
+    # One match through recordMatches rates the same as recordMatch.
+    for use_variance in [False, True]:
+        single, batch = Elo(use_variance = use_variance), Elo(use_variance = use_variance)
+        for elo in [single, batch]:
+            elo.addPlayer("Abe", 1100)
+            elo.addPlayer("Brenna")
+        single.recordMatch("Abe", "Brenna", winner = "Brenna")
+        batch.recordMatches(["Abe"], ["Brenna"], [0.0])
+        assert np.array_equal(single.ratings, batch.ratings)
+        assert np.array_equal(single.deviations, batch.deviations)
+
+    # Glickman's worked example: 1500 (200) beats 1400 (30), loses to 1550
+    # (100) and 1700 (300) in one period, for 1464 (151.4).
+    elo = Elo(use_variance = True)
+    for name, rating, deviation in [("Abe", 1500, 200), ("Brenna", 1400, 30), ("CardBot", 1550, 100), ("Dee", 1700, 300)]:
+        elo.addPlayer(name, rating)
+        elo.deviations[elo.players[name]] = deviation
+    elo.recordMatches(["Abe", "Abe", "Abe"], ["Brenna", "CardBot", "Dee"], [1.0, 0.0, 0.0])
+    assert abs(elo.getPlayerRating("Abe") - 1464) < 0.5
+    assert abs(elo.getRatingDeviation("Abe") - 151.4) < 0.5
+
+    # Bootstrapped intervals hold the ratings they're resampled around.
+    names = ["Abe", "Brenna", "CardBot"]
+    match_random = random.Random(1)
+    for use_variance in [False, True]:
+        elo = Elo(use_variance = use_variance)
+        for name in names:
+            elo.addPlayer(name)
+        for _ in range(30):
+            first, second = match_random.sample(names, 2)
+            elo.recordMatch(first, second, winner = match_random.choice([first, first, second, None]))
+        elo.recordMatches(["Abe", "Brenna"], ["CardBot", "CardBot"], [1.0, 0.5])
+        intervals = elo.getConfidenceIntervals(1000, seed = 3)
+        assert intervals == elo.getConfidenceIntervals(1000, seed = 3)
+        for name, rating in elo.getRatingList():
+            low, high = intervals[name]
+            assert low < rating < high
+
+        # A single sample is the drawn matches rated through recordMatches, period by period.
+        first, second, scores = elo._match_log
+        resampled = Elo(use_variance = use_variance)
+        for name in names:
+            resampled.addPlayer(name)
+        rng = np.random.default_rng(5)
+        for period_length in elo._period_lengths:
+            pick = rng.integers(0, len(scores), size = (1, period_length))[0]
+            resampled.recordMatches([names[first[i]] for i in pick], [names[second[i]] for i in pick], [scores[i] for i in pick])
+        sample = elo.getConfidenceIntervals(1, seed = 5)
+        for name, rating in resampled.getRatingList():
+            assert np.allclose(sample[name], (rating, rating))
+
+def test_build_corpus():
+    corpus = benchmark.build_corpus(5, [3, 8])
+    assert len(corpus) == 2 * 5 * 2
+    assert benchmark.get_corpus_hash(corpus) == benchmark.get_corpus_hash(benchmark.build_corpus(5, [3, 8]))
+    assert benchmark.get_corpus_hash(corpus) != benchmark.get_corpus_hash(benchmark.build_corpus(5, [3, 8], version = 0))
+    for case, round, cards, groups in corpus:
+        assert len(cards) == round + 1
+        assert case.endswith("/groups") or groups == []
+        for group in groups:
+            assert not any(card.is_wild(round) for card in group.cards)
+
+def test_compare_results():
+    def get_results(p50_ms, lines, corpus_hash = "abc"):
+        stats = {"p50_ms": p50_ms, "peak_kib": 10, "lines": lines}
+        return {"corpus_version": 2, "corpus_hash": corpus_hash, "hands_per_round": 5, "benchmarks": {"get_all_plays/round3/groups": stats}}
+
+    baseline = get_results(2.0, 100)
+    assert benchmark.compare_results(get_results(2.4, 100), baseline) == []
+    assert len(benchmark.compare_results(get_results(3.0, 100), baseline)) == 1
+    # Under the floor, however large the fraction.
+    assert benchmark.compare_results(get_results(0.4, 100), get_results(0.1, 100)) == []
+    # Searching fewer lines is reported, but isn't a regression.
+    assert benchmark.compare_results(get_results(1.0, 60), baseline) == []
+    assert benchmark.compare_lines(get_results(1.0, 60), baseline) == ["get_all_plays/round3/groups: yielded 60 lines, baseline 100"]
+    try:
+        benchmark.compare_results(get_results(2.0, 100, "def"), baseline)
+        assert False
+    except Exception as e:
+        assert "different corpus" in str(e)
+
 def run_tests():
     test_get_sets()
     test_get_runs()
@@ -665,11 +1346,36 @@ def run_tests():
     test_is_valid_run()
     test_get_non_wild_set_values_on_groups()
     test_get_all_plays()
+    test_get_all_plays_skips_reordered_lines()
+    test_get_all_plays_leaves_inputs_untouched()
     test_optimal_plays()
+    test_card_encoding()
+    test_bitboard_hand()
+    test_transposition_table()
+    test_find_best_play()
+    test_determine_play_goes_out()
+    test_get_score_lower_bound()
+    test_extension_tables()
+    test_meld_index()
+    test_public_table()
+    test_seeded_deck()
+    test_event_log()
+    test_replay()
+    test_incremental_best_play()
+    test_find_best_play_with_draw()
+    test_choose_discard()
+    test_find_best_play_by_deadline()
+    test_batch_round_simulator()
+    test_go_out_line_shape()
+    test_read_results()
+    test_resume_tournament()
+    test_elo()
+    test_build_corpus()
+    test_compare_results()
     
 if __name__ == "__main__":
     
-    logging.getLogger().setLevel(logging.DEBUG)
+    logging.basicConfig(level=logging.DEBUG)
     t0 = time.time()
     run_tests()
     t1 = time.time()